@@ -0,0 +1,265 @@
+# src/benchmarks/run.py
+"""
+Benchmark the loader, trial parsing, matcher and output stages on synthetic
+data and write the results as JSON.
+
+    PYTHONPATH=/path/to/project python3 -m src.benchmarks.run \
+        --sizes 10000 100000 1000000 --output benchmark_results.json
+
+Each measurement runs in a fresh process and the RSS high-water mark is reset
+right before the timed section, so peak_rss_mb belongs to that stage alone.
+Output formats are measured one at a time. Generated cohorts are kept under
+--work-dir and reused by later runs.
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+from src.benchmarks.synthetic import generate_cohort, generate_trials, search_results_xml, study_xml
+from src.data_loader import PatientDataLoader
+from src.matcher import TrialMatcher
+from src.metrics import current_rss_mb, peak_rss_mb, reset_peak_rss
+from src.output import OutputGenerator
+from src.trial_cache import TrialCache
+from src.trial_scraper import TrialScraper
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# Distinct patients whose matches are replayed to benchmark output writing
+OUTPUT_SAMPLE = 5_000
+
+
+def _measure(stage: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    reset_peak_rss()
+    rss_before = current_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = stage()
+    result.update(
+        seconds=time.perf_counter() - wall_start,
+        cpu_seconds=time.process_time() - cpu_start,
+        rss_before_mb=rss_before,
+        peak_rss_mb=peak_rss_mb(),
+    )
+    return result
+
+
+class _TrialAPIHandler(BaseHTTPRequestHandler):
+    """Serves pre-rendered studies by rank, like the search endpoint."""
+
+    studies: List[str] = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        start = int(query.get('min_rnk', 1))
+        stop = int(query.get('max_rnk', len(self.studies)))
+        body = search_results_xml(self.studies[start - 1:stop], len(self.studies))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def bench_scraper(work_dir: Path, n_trials: int, seed: int) -> Dict[str, Any]:
+    """Fetch and parse every study from a local server; saves the trial snapshot for the matcher."""
+    _TrialAPIHandler.studies = [study_xml(trial) for trial in generate_trials(n_trials, seed)]
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TrialAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scraper = TrialScraper(base_url=f'http://127.0.0.1:{server.server_address[1]}/', requests_per_second=None)
+    trials = []
+
+    def fetch():
+        trials.extend(scraper.get_active_trials())
+        return {'trials': len(trials)}
+    try:
+        result = _measure(fetch)
+    finally:
+        server.shutdown()
+    TrialCache(str(work_dir / 'trials.json')).save(trials)
+    result['throughput'] = result['trials'] / result['seconds']
+    result['throughput_unit'] = 'trials/s'
+    return result
+
+
+def bench_loader(data_dir: Path, cache_dir: Optional[Path]) -> Dict[str, Any]:
+    def load():
+        loader = PatientDataLoader(str(data_dir), cache_dir=str(cache_dir) if cache_dir else None)
+        return {'patients': len(loader.store), 'store_mb': loader.store.nbytes() / (1024 * 1024)}
+    result = _measure(load)
+    result['throughput'] = result['patients'] / result['seconds']
+    result['throughput_unit'] = 'patients/s'
+    return result
+
+
+def _matcher(work_dir: Path, data_dir: Path, cache_dir: Path, workers: int) -> TrialMatcher:
+    # The warm cohort cache is memory-mapped, so loading adds little to the stage's peak RSS
+    loader = PatientDataLoader(str(data_dir), cache_dir=str(cache_dir))
+    scraper = TrialScraper(cache_path=str(work_dir / 'trials.json'), offline=True)
+    return TrialMatcher(loader, scraper, workers=workers)
+
+
+def bench_matcher(work_dir: Path, data_dir: Path, cache_dir: Path, workers: int) -> Dict[str, Any]:
+    matcher = _matcher(work_dir, data_dir, cache_dir, workers)
+
+    def match():
+        matches = matcher.match_all_patients()
+        return {
+            'patients': len(matches),
+            'trials': len(matcher.active_trials),
+            'matches': sum(len(eligible_trials) for eligible_trials in matches.values()),
+        }
+    result = _measure(match)
+    result['throughput'] = result['patients'] / result['seconds']
+    result['throughput_unit'] = 'patients/s'
+    return result
+
+
+def bench_output(work_dir: Path, data_dir: Path, cache_dir: Path, n_patients: int,
+                 output_format: str) -> Dict[str, Any]:
+    """Stream n_patients results, replayed from a sample of real matches, through one writer."""
+    matcher = _matcher(work_dir, data_dir, cache_dir, workers=1)
+    sample = list(itertools.islice(matcher.iter_matches(), OUTPUT_SAMPLE))
+    output_dir = Path(tempfile.mkdtemp(dir=work_dir))
+
+    def replay():
+        for i, (_, eligible_trials) in zip(range(n_patients), itertools.cycle(sample)):
+            yield f'patient-{i:09d}', eligible_trials
+
+    def write():
+        paths = OutputGenerator(str(output_dir), [output_format]).write(replay())
+        return {
+            'patients': n_patients,
+            'output_mb': sum(
+                sum(f.stat().st_size for f in path.rglob('*')) if path.is_dir() else path.stat().st_size
+                for path in paths.values()
+            ) / (1024 * 1024),
+        }
+    try:
+        result = _measure(write)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    result['throughput'] = result['patients'] / result['seconds']
+    result['throughput_unit'] = 'patients/s'
+    return result
+
+
+def _run_isolated(function: Callable, *args) -> Dict[str, Any]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes: List[int], n_trials: int, work_dir: Path, workers: int,
+                   formats: List[str], seed: int = 0) -> Dict[str, Any]:
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+
+    def record(stage: str, patients: Optional[int], result: Dict[str, Any]) -> None:
+        result = dict(stage=stage, size=patients, **result)
+        results.append(result)
+        print(f"{stage:>14} {patients or '':>9} {result['seconds']:9.2f}s "
+              f"{result['throughput']:12.0f} {result['throughput_unit']:<11} peak {result['peak_rss_mb']:8.1f} MB")
+
+    record('scraper', None, _run_isolated(bench_scraper, work_dir, n_trials, seed))
+
+    for size in sizes:
+        data_dir = work_dir / f'cohort_{size}_{seed}'
+        if not (data_dir / 'observations.csv').exists():
+            print(f"Generating {size} patients in {data_dir}")
+            generate_cohort(data_dir, size, seed)
+        cache_dir = work_dir / f'cache_{size}_{seed}'
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        record('loader', size, _run_isolated(bench_loader, data_dir, None))
+        # First cached load parses and writes the cache; the second one is the warm path
+        _run_isolated(bench_loader, data_dir, cache_dir)
+        record('loader_cached', size, _run_isolated(bench_loader, data_dir, cache_dir))
+        record('matcher', size, _run_isolated(bench_matcher, work_dir, data_dir, cache_dir, workers))
+        for output_format in formats:
+            record(f'output_{output_format}', size,
+                   _run_isolated(bench_output, work_dir, data_dir, cache_dir, size, output_format))
+
+    return {
+        'environment': _environment(),
+        'parameters': {'sizes': sizes, 'trials': n_trials, 'workers': workers, 'formats': formats, 'seed': seed},
+        'results': results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Tuple[str, Any, float, float]]:
+    """(stage, size, throughput ratio, peak RSS ratio) of current over baseline for every shared measurement."""
+    previous = {(r['stage'], r['size']): r for r in baseline['results']}
+    ratios = []
+    for result in current['results']:
+        before = previous.get((result['stage'], result['size']))
+        if before:
+            ratios.append((
+                result['stage'], result['size'],
+                result['throughput'] / before['throughput'],
+                result['peak_rss_mb'] / before['peak_rss_mb'],
+            ))
+    return ratios
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--trials', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--formats', nargs='+', default=['json', 'ndjson', 'parquet', 'excel'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', type=Path, default=Path(tempfile.gettempdir()) / 'trial_matcher_bench')
+    parser.add_argument('--output', type=Path, default=Path('benchmark_results.json'))
+    parser.add_argument('--compare', type=Path, help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    report = run_benchmarks(args.sizes, args.trials, args.work_dir, args.workers, args.formats, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("Compared with", args.compare)
+        for stage, size, throughput, peak_rss in compare(baseline, report):
+            print(f"{stage:>14} {size or '':>9}  throughput x{throughput:.2f}  peak RSS x{peak_rss:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+# src/benchmarks/synthetic.py
+"""
+Deterministic synthetic inputs for the benchmarks: Synthea-shaped CSVs and
+ClinicalTrials.gov-shaped trial XML. The same seed and sizes always produce
+byte-identical files, so timings can be compared across commits.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Any
+from xml.sax.saxutils import escape
+
+# A few real Synthea SNOMED / RxNorm codes, padded out with generated ones so
+# code frequencies follow a long tail like real cohorts.
+COMMON_CONDITION_CODES = [
+    '44054006', '38341003', '15777000', '195662009', '10509002', '162864005', '271737000',
+    '55822004', '59621000', '40055000', '233604007', '444814009', '19169002', '40275004',
+]
+COMMON_MEDICATION_CODES = [
+    '860975', '314076', '197361', '310798', '849574', '1049221', '308136', '313782',
+]
+CONDITION_NAMES = [
+    'Diabetes Mellitus, Type 2', 'Hypertension', 'Prediabetes', 'Chronic Kidney Disease',
+    'Obesity', 'Hyperlipidemia', 'Asthma', 'Heart Failure', 'Anemia', 'Sinusitis',
+]
+# LOINC code -> (name used in eligibility text, mean, standard deviation)
+LAB_DISTRIBUTIONS = {
+    '4548-4': ('HbA1c', 6.2, 1.2),
+    '2339-0': ('Fasting glucose', 105.0, 25.0),
+    '33914-3': ('eGFR', 80.0, 20.0),
+    '38483-4': ('Serum creatinine', 1.0, 0.3),
+    '18262-6': ('LDL cholesterol', 110.0, 30.0),
+    '2085-9': ('HDL cholesterol', 50.0, 12.0),
+    '2093-3': ('Total cholesterol', 190.0, 35.0),
+    '2571-8': ('Triglycerides', 140.0, 50.0),
+    '718-7': ('Hemoglobin', 14.0, 1.5),
+    '777-3': ('Platelet count', 250.0, 60.0),
+    '6298-4': ('Potassium', 4.2, 0.4),
+    '2947-0': ('Sodium', 140.0, 3.0),
+    '39156-5': ('BMI', 28.0, 5.0),
+    '8480-6': ('Systolic blood pressure', 125.0, 15.0),
+    '8462-4': ('Diastolic blood pressure', 80.0, 10.0),
+}
+
+N_CONDITION_CODES = 400
+N_MEDICATION_CODES = 200
+PATIENT_CHUNK = 100_000
+
+
+def condition_codes() -> List[str]:
+    return COMMON_CONDITION_CODES + [str(100000000 + i * 7919) for i in range(N_CONDITION_CODES - len(COMMON_CONDITION_CODES))]
+
+
+def medication_codes() -> List[str]:
+    return COMMON_MEDICATION_CODES + [str(200000 + i * 613) for i in range(N_MEDICATION_CODES - len(COMMON_MEDICATION_CODES))]
+
+
+def _zipf_choice(rng: np.random.RandomState, n_codes: int, size: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n_codes + 1)
+    return rng.choice(n_codes, size=size, p=weights / weights.sum())
+
+
+def _patient_ids(rng: np.random.RandomState, n: int) -> List[str]:
+    high = rng.randint(0, 2 ** 63, size=n, dtype=np.int64)
+    low = rng.randint(0, 2 ** 63, size=n, dtype=np.int64)
+    return [
+        f'{h >> 31:08x}-{(h >> 15) & 0xffff:04x}-{h & 0x7fff:04x}-{low_bits >> 47:04x}-{low_bits & 0xffffffffffff:012x}'
+        for h, low_bits in zip(high.tolist(), low.tolist())
+    ]
+
+
+def generate_cohort(data_dir: Path, n_patients: int, seed: int = 0) -> Path:
+    """
+    Write patients.csv, conditions.csv, medications.csv and observations.csv
+    for n_patients, PATIENT_CHUNK patients at a time. Returns data_dir.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    conditions = np.array(condition_codes())
+    medications = np.array(medication_codes())
+    lab_codes = np.array(list(LAB_DISTRIBUTIONS))
+    lab_means = np.array([LAB_DISTRIBUTIONS[code][1] for code in lab_codes])
+    lab_stds = np.array([LAB_DISTRIBUTIONS[code][2] for code in lab_codes])
+    start_day = np.datetime64('2010-01-01')
+
+    for chunk_start in range(0, n_patients, PATIENT_CHUNK):
+        n = min(PATIENT_CHUNK, n_patients - chunk_start)
+        ids = np.array(_patient_ids(rng, n), dtype=object)
+        birth = np.datetime64('1930-01-01') + rng.randint(0, 365 * 90, size=n).astype('timedelta64[D]')
+        dead = rng.random_sample(n) < 0.05
+        death = birth + rng.randint(365 * 20, 365 * 90, size=n).astype('timedelta64[D]')
+        death = np.where(dead & (death < np.datetime64('2024-01-01')), death.astype(str), '')
+        patients = pd.DataFrame({
+            'Id': ids,
+            'BIRTHDATE': birth.astype(str),
+            'DEATHDATE': death,
+            'SSN': '999-00-0000',
+            'GENDER': np.where(rng.random_sample(n) < 0.5, 'F', 'M'),
+            'CITY': 'Springfield',
+        })
+
+        n_conditions = rng.poisson(6, size=n)
+        condition_rows = np.repeat(np.arange(n), n_conditions)
+        condition_frame = pd.DataFrame({
+            'START': (start_day + rng.randint(0, 5000, size=len(condition_rows)).astype('timedelta64[D]')).astype(str),
+            'STOP': '',
+            'PATIENT': ids[condition_rows],
+            'ENCOUNTER': 'e',
+            'CODE': conditions[_zipf_choice(rng, len(conditions), len(condition_rows))],
+            'DESCRIPTION': 'condition',
+        })
+
+        n_medications = rng.poisson(4, size=n)
+        medication_rows = np.repeat(np.arange(n), n_medications)
+        medication_frame = pd.DataFrame({
+            'START': (start_day + rng.randint(0, 5000, size=len(medication_rows)).astype('timedelta64[D]')).astype(str),
+            'STOP': '',
+            'PATIENT': ids[medication_rows],
+            'PAYER': 'p',
+            'ENCOUNTER': 'e',
+            'CODE': medications[_zipf_choice(rng, len(medications), len(medication_rows))],
+            'DESCRIPTION': 'medication',
+        })
+
+        n_observations = rng.poisson(8, size=n)
+        observation_rows = np.repeat(np.arange(n), n_observations)
+        lab = rng.randint(0, len(lab_codes), size=len(observation_rows))
+        values = np.round(rng.normal(lab_means[lab], lab_stds[lab]), 1)
+        text = rng.random_sample(len(observation_rows)) < 0.05
+        observation_frame = pd.DataFrame({
+            'DATE': (start_day + rng.randint(0, 5000, size=len(observation_rows)).astype('timedelta64[D]')).astype(str),
+            'PATIENT': ids[observation_rows],
+            'ENCOUNTER': 'e',
+            'CATEGORY': 'laboratory',
+            'CODE': lab_codes[lab],
+            'DESCRIPTION': 'observation',
+            'VALUE': np.where(text, 'Never smoker', values.astype(str)),
+            'UNITS': 'u',
+            'TYPE': np.where(text, 'text', 'numeric'),
+        })
+
+        first = chunk_start == 0
+        for name, frame in (('patients', patients), ('conditions', condition_frame),
+                            ('medications', medication_frame), ('observations', observation_frame)):
+            frame.to_csv(data_dir / f'{name}.csv', mode='w' if first else 'a', header=first, index=False)
+
+    return data_dir
+
+
+def generate_trials(n_trials: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Trial descriptions in the shape the XML API returns them, before parsing."""
+    rng = np.random.RandomState(seed + 1)
+    conditions = condition_codes()
+    medications = medication_codes()
+    lab_codes = list(LAB_DISTRIBUTIONS)
+    trials = []
+    for i in range(n_trials):
+        # Uniform over the code pool, so common patient codes do not put every trial in reach
+        trial_conditions = [conditions[j] for j in rng.randint(0, len(conditions), size=rng.randint(1, 4))]
+        if rng.random_sample() < 0.5:
+            trial_conditions.append(CONDITION_NAMES[rng.randint(len(CONDITION_NAMES))])
+
+        inclusion = ['Signed informed consent']
+        for code in rng.choice(lab_codes, size=rng.poisson(0.7), replace=False):
+            name, mean, std = LAB_DISTRIBUTIONS[code]
+            low, high = round(mean - 2 * std, 1), round(mean + 2 * std, 1)
+            inclusion.append(f'{name} between {low} and {high}')
+
+        exclusion = ['Pregnant or breastfeeding']
+        for _ in range(rng.poisson(1.5)):
+            if rng.random_sample() < 0.5:
+                exclusion.append(f'Current use of {medications[_zipf_choice(rng, len(medications), 1)[0]]}')
+            else:
+                exclusion.append(f'History of {conditions[rng.randint(len(conditions))]}')
+
+        minimum_age = [None, '18 Years', '18 Years', '40 Years', '6 Months'][rng.randint(5)]
+        maximum_age = [None, '65 Years', '75 Years', '90 Years'][rng.randint(4)]
+        trials.append({
+            'nct_id': f'NCT{10000000 + i:08d}',
+            'brief_title': f'Synthetic study {i} of {trial_conditions[0]}',
+            'overall_status': 'Recruiting',
+            'conditions': trial_conditions,
+            'inclusion': inclusion,
+            'exclusion': exclusion,
+            'minimum_age': minimum_age,
+            'maximum_age': maximum_age,
+            'gender': ['All', 'All', 'All', 'F', 'M'][rng.randint(5)],
+            'last_update_posted': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}',
+        })
+    return trials
+
+
+def study_xml(trial: Dict[str, Any]) -> str:
+    parts = [
+        f'<clinical_study><nct_id>{trial["nct_id"]}</nct_id>',
+        f'<brief_title>{escape(trial["brief_title"])}</brief_title>',
+        f'<overall_status>{trial["overall_status"]}</overall_status>',
+    ]
+    parts.extend(f'<condition>{escape(condition)}</condition>' for condition in trial['conditions'])
+    parts.append(f'<inclusion_criteria><textblock>\n{escape(chr(10).join(trial["inclusion"]))}\n</textblock></inclusion_criteria>')
+    parts.append(f'<exclusion_criteria><textblock>\n{escape(chr(10).join(trial["exclusion"]))}\n</textblock></exclusion_criteria>')
+    for tag in ('minimum_age', 'maximum_age'):
+        if trial[tag] is not None:
+            parts.append(f'<{tag}>{trial[tag]}</{tag}>')
+    parts.append(f'<gender>{trial["gender"]}</gender>')
+    parts.append(f'<last_update_posted>{trial["last_update_posted"]}</last_update_posted></clinical_study>')
+    return ''.join(parts)
+
+
+def search_results_xml(studies: List[str], count: int) -> bytes:
+    """One API response page: the total count followed by the page's studies."""
+    return (f'<search_results><count>{count}</count>' + ''.join(studies) + '</search_results>').encode('utf-8')
@@ -0,0 +1,40 @@
+# src/bounded_cache.py
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class BoundedCache(Generic[K, V]):
+    """
+    Least-recently-used memo of at most max_size values, for lookups keyed by
+    client-supplied input. Safe to share between server threads: a race can
+    only compute a value twice or evict one early.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._values: 'OrderedDict[K, V]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: K, compute: Callable[[K], V]) -> V:
+        """The cached value for key, computing and storing it on a miss."""
+        value = self._values.get(key)
+        if value is not None:
+            try:
+                self._values.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread in the meantime
+                pass
+            return value
+        value = compute(key)
+        self._values[key] = value
+        while len(self._values) > self.max_size:
+            try:
+                self._values.popitem(last=False)
+            except KeyError:
+                break
+        return value
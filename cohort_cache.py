@@ -0,0 +1,125 @@
+# src/cohort_cache.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+from src.patient_store import PatientStore
+
+CACHE_VERSION = 3
+
+
+class CohortCache:
+    """
+    On-disk cache of a parsed PatientStore for one Synthea directory.
+
+    The cache is keyed on the size, mtime and SHA-256 of every source CSV the
+    loader reads. A size change invalidates it straight away; an mtime change
+    only invalidates it if the content hash changed too, so touching a file
+    does not force a re-parse. Ages are not taken from the cache as they
+    were on the day it was built: load() recomputes them from the cached
+    birth and death dates. A cache whose arrays cannot be read is treated
+    like a stale one, so the loader re-parses the CSVs and overwrites it.
+    """
+
+    def __init__(self, cache_dir: str, data_dir: Path, source_files: List[str]):
+        self.logger = logging.getLogger(__name__)
+        self.data_dir = Path(data_dir)
+        self.source_files = source_files
+        key = hashlib.sha1(str(self.data_dir.resolve()).encode('utf-8')).hexdigest()[:16]
+        self.path = Path(cache_dir) / f'cohort_{key}'
+        self.manifest_path = self.path / 'manifest.json'
+
+    def load(self) -> Optional[PatientStore]:
+        if not self.manifest_path.exists():
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable cache manifest {self.manifest_path}: {str(e)}")
+            return None
+
+        if manifest.get('version') != CACHE_VERSION:
+            return None
+        sources = self._validate_sources(manifest.get('sources', {}))
+        if sources is None:
+            self.logger.info(f"Patient cache {self.path} is stale")
+            return None
+
+        if sources != manifest['sources']:
+            # Files were touched but their content is unchanged; remember the new mtimes.
+            manifest['sources'] = sources
+            self._write_manifest(manifest)
+
+        self.logger.info(f"Loading patient data from cache {self.path}")
+        try:
+            store = PatientStore.load(self.path / 'store', mmap=True)
+            # Ages depend on today's date, not only on the source files
+            store.refresh_ages()
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring damaged patient cache {self.path}: {str(e)}")
+            return None
+        return store
+
+    def save(self, store: PatientStore) -> None:
+        manifest = {
+            'version': CACHE_VERSION,
+            'data_dir': str(self.data_dir.resolve()),
+            'sources': {name: self._fingerprint(self.data_dir / name) for name in self._existing_sources()},
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        try:
+            store.save(tmp_path / 'store')
+            with open(tmp_path / 'manifest.json', 'w') as f:
+                json.dump(manifest, f, indent=2)
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write patient cache {self.path}: {str(e)}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.logger.info(f"Saved patient cache to {self.path}")
+
+    def _validate_sources(self, cached: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Dict[str, Any]]]:
+        existing = self._existing_sources()
+        if sorted(existing) != sorted(cached):
+            return None
+
+        sources = {}
+        for name in existing:
+            path = self.data_dir / name
+            stat = path.stat()
+            entry = cached[name]
+            if stat.st_size != entry['size']:
+                return None
+            if stat.st_mtime_ns != entry['mtime_ns']:
+                if self._hash_file(path) != entry['sha256']:
+                    return None
+                entry = dict(entry, mtime_ns=stat.st_mtime_ns)
+            sources[name] = entry
+        return sources
+
+    def _existing_sources(self) -> List[str]:
+        return [name for name in self.source_files if (self.data_dir / name).exists()]
+
+    def _fingerprint(self, path: Path) -> Dict[str, Any]:
+        stat = path.stat()
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': self._hash_file(path)}
+
+    def _hash_file(self, path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        try:
+            with open(self.manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Could not update cache manifest {self.manifest_path}: {str(e)}")
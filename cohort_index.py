@@ -0,0 +1,103 @@
+# src/cohort_index.py
+import numpy as np
+from typing import Iterable
+from src.eligibility_plan import EligibilityPlan
+from src.exclusion_index import ExclusionIndex
+from src.lab_criteria import LabCriteriaIndex
+from src.patient_store import PatientStore
+from src.trial_index import ConditionMatchTable, normalize_condition
+
+
+class CohortIndex:
+    """
+    Patient-side index over a PatientStore, for evaluating one trial against
+    the whole cohort at once.
+
+    Condition and medication codes are inverted from the store's per-patient
+    CSR arrays into per-code runs of patient rows (CSC), and patient rows are
+    kept sorted by age. A trial's criteria then become boolean masks over the
+    cohort: an age range is a slice of the sorted rows, a code set is the
+    union of its runs. Per-code bitmaps would need vocabulary x cohort bits,
+    so the runs are only expanded into masks for the codes a query touches.
+
+    Depends only on the patients, so it stays valid when trials are reloaded.
+    """
+
+    def __init__(self, store: PatientStore):
+        self.store = store
+        self.n_patients = len(store)
+        ages = np.asarray(store.ages)
+        self._rows_by_age = np.argsort(ages, kind='stable')
+        self._sorted_ages = ages[self._rows_by_age]
+        self._gender_codes = np.asarray(store.gender_codes)
+        n_codes = len(store.vocabulary)
+        self._condition_offsets, self._condition_rows = self._invert(
+            store.condition_offsets, store.condition_values, n_codes)
+        self._medication_offsets, self._medication_rows = self._invert(
+            store.medication_offsets, store.medication_values, n_codes)
+        self._normalized_vocabulary = np.array([normalize_condition(code) for code in store.vocabulary], dtype=str)
+        self._code_ids = {}
+        for code_id, code in enumerate(store.vocabulary):
+            self._code_ids.setdefault(code.lower(), []).append(code_id)
+
+    @staticmethod
+    def _invert(offsets: np.ndarray, values: np.ndarray, n_codes: int):
+        """Turn a row -> codes CSR into code -> sorted, distinct patient rows."""
+        rows = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+        pairs = np.unique(np.asarray(values, dtype=np.int64) * max(len(offsets) - 1, 1) + rows)
+        codes, rows = np.divmod(pairs, max(len(offsets) - 1, 1))
+        code_offsets = np.zeros(n_codes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=n_codes), out=code_offsets[1:])
+        return code_offsets, rows.astype(np.int32)
+
+    def _rows_with(self, offsets: np.ndarray, rows: np.ndarray, code_ids: Iterable[int], mask: np.ndarray) -> None:
+        for code_id in code_ids:
+            mask[rows[offsets[code_id]:offsets[code_id + 1]]] = True
+
+    def age_mask(self, min_age: float, max_age: float) -> np.ndarray:
+        mask = np.zeros(self.n_patients, dtype=bool)
+        start = np.searchsorted(self._sorted_ages, min_age, side='left')
+        stop = np.searchsorted(self._sorted_ages, max_age, side='right')
+        mask[self._rows_by_age[start:stop]] = True
+        return mask
+
+    def gender_mask(self, gender: str) -> np.ndarray:
+        """Patients whose gender equals gender case-insensitively; unknown genders never match."""
+        categories = [code for code, category in enumerate(self.store.gender_categories) if category.lower() == gender]
+        return np.isin(self._gender_codes, categories)
+
+    def condition_mask(self, condition_ids: np.ndarray, condition_table: ConditionMatchTable) -> np.ndarray:
+        """Patients with a condition code that matches any of the trial conditions."""
+        mask = np.zeros(self.n_patients, dtype=bool)
+        if len(condition_ids):
+            code_ids = np.flatnonzero(condition_table.code_mask(condition_ids, self._normalized_vocabulary))
+            self._rows_with(self._condition_offsets, self._condition_rows, code_ids, mask)
+        return mask
+
+    def code_mask(self, codes: Iterable[str]) -> np.ndarray:
+        """Patients with any of the (lowercased) codes as a condition or a medication."""
+        mask = np.zeros(self.n_patients, dtype=bool)
+        for code in codes:
+            code_ids = self._code_ids.get(code, ())
+            self._rows_with(self._condition_offsets, self._condition_rows, code_ids, mask)
+            self._rows_with(self._medication_offsets, self._medication_rows, code_ids, mask)
+        return mask
+
+    def eligible_rows(self, plan: EligibilityPlan, condition_table: ConditionMatchTable,
+                      exclusion_index: ExclusionIndex, lab_index: LabCriteriaIndex) -> np.ndarray:
+        """
+        Sorted rows of every patient that passes plan, with the same result
+        as evaluating the plan patient by patient.
+        """
+        eligible = self.condition_mask(plan.condition_ids, condition_table)
+        if not eligible.any():
+            return np.flatnonzero(eligible)
+        eligible &= self.age_mask(plan.min_age, plan.max_age)
+        if plan.gender is not None:
+            eligible &= self.gender_mask(plan.gender)
+        excluding_codes = exclusion_index.excluding_codes(plan.position)
+        if excluding_codes:
+            eligible &= ~self.code_mask(excluding_codes)
+        if plan.lab_ranges:
+            eligible &= ~lab_index.rejected_patients(plan.position, self.n_patients)
+        return np.flatnonzero(eligible)
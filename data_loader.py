@@ -1,14 +1,35 @@
+import numpy as np
 import pandas as pd
 import logging 
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+from src.patient_store import PatientStore, calculate_ages
+from src.cohort_cache import CohortCache
 
 class PatientDataLoader:
-    def __init__(self, data_dir: str):
+    # Only these Synthea files/columns are used by the matcher; everything else
+    # (encounters, claims, ...) is skipped by the vectorized loader.
+    PATIENT_COLUMNS = ['Id', 'BIRTHDATE', 'DEATHDATE', 'GENDER']
+    CODE_FILES = {
+        'conditions': 'condition_codes',
+        'medications': 'medication_codes',
+    }
+    LAB_FILE = 'observations'
+    LAB_COLUMNS = ['DATE', 'PATIENT', 'CODE', 'VALUE', 'TYPE']
+
+    def __init__(self, data_dir: str, vectorized: bool = True, chunksize: int = 500_000,
+                 cache_dir: Optional[str] = None):
         self.logger = logging.getLogger(__name__)
         self.data_dir = Path(data_dir)
-        self.patients_data = self._load_patient_data()
+        self.chunksize = chunksize
+        self.cache = CohortCache(cache_dir, self.data_dir, self.source_files()) if cache_dir else None
+        if vectorized:
+            self.store = self._load_cached_patient_store()
+            self.patients_data = self.store
+        else:
+            self.patients_data = self._load_patient_data()
+            self.store = PatientStore.from_records(self.patients_data)
         self.logger.info(f"Loaded {len(self.patients_data)} patient records")
     def _load_patient_data(self) -> Dict[str, Dict[str, Any]]:
         self.logger.info(f"Loading patient data from {self.data_dir}")
@@ -33,6 +54,7 @@ class PatientDataLoader:
                         'gender': row['GENDER'],
                         'condition_codes': [],
                         'medication_codes': [],
+                        'recent_lab_results': {},
                     }
             except Exception as e:
                 self.logger.error(f"Error parsing {patients_file}: {str(e)}")
@@ -43,6 +65,9 @@ class PatientDataLoader:
                 continue  # Already processed
             try:
                 df = pd.read_csv(csv_file)
+                if csv_file.stem == self.LAB_FILE and 'DATE' in df.columns:
+                    # Process oldest first so the latest value per code wins
+                    df = df.sort_values('DATE', kind='stable')
                 if 'PATIENT' in df.columns:
                     self._process_patient_related_file(df, patients_data, csv_file.stem)
             except Exception as e:
@@ -56,11 +81,153 @@ class PatientDataLoader:
             patient_id = str(row['PATIENT'])
             if patient_id in patients_data:
                 if file_type == 'conditions':
-                    patients_data[patient_id]['condition_codes'].append(row['CODE'])
+                    patients_data[patient_id]['condition_codes'].append(str(row['CODE']))
                 elif file_type == 'medications':
-                    patients_data[patient_id]['medication_codes'].append(row['CODE'])
+                    patients_data[patient_id]['medication_codes'].append(str(row['CODE']))
+                elif file_type == self.LAB_FILE and row.get('TYPE', 'numeric') == 'numeric':
+                    value = pd.to_numeric(row['VALUE'], errors='coerce')
+                    if pd.notna(value):
+                        patients_data[patient_id]['recent_lab_results'][str(row['CODE'])] = float(value)
                 
 
+    def source_files(self) -> List[str]:
+        """Names of the Synthea files the vectorized loader reads."""
+        return ['patients.csv'] + [f'{file_type}.csv' for file_type in self.CODE_FILES] + [f'{self.LAB_FILE}.csv']
+
+    def _load_cached_patient_store(self) -> PatientStore:
+        if self.cache is None:
+            return self._load_patient_store()
+
+        store = self.cache.load()
+        if store is None:
+            store = self._load_patient_store()
+            self.cache.save(store)
+        return store
+
+    def _load_patient_store(self) -> PatientStore:
+        self.logger.info(f"Loading patient data from {self.data_dir} (vectorized)")
+        patients_file = self.data_dir / 'patients.csv'
+        patients_df = pd.DataFrame(columns=self.PATIENT_COLUMNS)
+
+        if not patients_file.exists():
+            self.logger.warning(f"No patients.csv found in {self.data_dir}")
+        else:
+            try:
+                patients_df = self._read_csv_chunked(
+                    patients_file,
+                    usecols=self.PATIENT_COLUMNS,
+                    dtype={'Id': str, 'GENDER': 'category'},
+                )
+            except Exception as e:
+                self.logger.error(f"Error parsing {patients_file}: {str(e)}")
+
+        birthdates = pd.to_datetime(patients_df['BIRTHDATE'])
+        deathdates = pd.to_datetime(patients_df['DEATHDATE'])
+        ages = self._calculate_ages(birthdates, deathdates)
+        ids_index = pd.Index(patients_df['Id'])
+        vocabulary: Dict[str, int] = {}
+        code_ids = {
+            field: self._load_code_ids(self.data_dir / f'{file_type}.csv', ids_index, vocabulary)
+            for file_type, field in self.CODE_FILES.items()
+        }
+
+        labs = self._load_latest_labs(self.data_dir / f'{self.LAB_FILE}.csv')
+
+        store = PatientStore.from_code_ids(
+            ids_index,
+            ages.to_numpy(),
+            patients_df['GENDER'],
+            list(vocabulary),
+            *code_ids['condition_codes'],
+            *code_ids['medication_codes'],
+            labs,
+            birthdates=birthdates,
+            deathdates=deathdates,
+        )
+        self.logger.info(f"Loaded data for {len(store)} patients ({store.nbytes() / 1e6:.1f} MB)")
+        return store
+
+    def _load_code_ids(self, csv_file: Path, ids_index: pd.Index,
+                       vocabulary: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Patient rows (-1 for unknown patients) and code ids of a Synthea
+        PATIENT/CODE file, in file order. Each chunk is reduced to two int
+        arrays as it is read, so the string columns are never held for the
+        whole file. New codes are added to vocabulary (code -> id) in order of
+        first appearance, once the whole file has been read.
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        if not csv_file.exists():
+            return empty
+        file_vocabulary: Dict[str, int] = {}
+        rows, file_code_ids = [], []
+        try:
+            chunks = pd.read_csv(csv_file, usecols=['PATIENT', 'CODE'], dtype={'PATIENT': str, 'CODE': str},
+                                 chunksize=self.chunksize)
+            for chunk in chunks:
+                codes, uniques = pd.factorize(chunk['CODE'])
+                known = (codes >= 0) & chunk['PATIENT'].notna().to_numpy()
+                chunk_ids = np.array([file_vocabulary.setdefault(code, len(file_vocabulary)) for code in uniques],
+                                     dtype=np.int64)
+                rows.append(ids_index.get_indexer(chunk['PATIENT'][known]))
+                file_code_ids.append(chunk_ids[codes[known]])
+        except Exception as e:
+            self.logger.error(f"Error parsing {csv_file}: {str(e)}")
+            return empty
+
+        if not rows:
+            return empty
+        to_vocabulary = np.array([vocabulary.setdefault(code, len(vocabulary)) for code in file_vocabulary],
+                                 dtype=np.int64)
+        return np.concatenate(rows), to_vocabulary[np.concatenate(file_code_ids)]
+
+    def _load_latest_labs(self, csv_file: Path) -> pd.DataFrame:
+        """
+        Latest numeric value per (PATIENT, CODE) from observations.csv. Each chunk
+        is reduced to its own latest values before the final reduction, so only
+        one row per patient and code is kept in memory, never the whole file.
+        """
+        empty = pd.DataFrame({'PATIENT': pd.Series(dtype=str), 'CODE': pd.Series(dtype=str),
+                              'VALUE': pd.Series(dtype=float)})
+        if not csv_file.exists():
+            return empty
+
+        columns = set(self.LAB_COLUMNS)
+        partials = []
+        try:
+            chunks = pd.read_csv(
+                csv_file,
+                usecols=lambda column: column in columns,
+                dtype={'DATE': str, 'PATIENT': str, 'CODE': str, 'VALUE': str, 'TYPE': 'category'},
+                chunksize=self.chunksize,
+            )
+            for chunk in chunks:
+                if 'TYPE' in chunk.columns:
+                    chunk = chunk[chunk['TYPE'] == 'numeric']
+                chunk = chunk.assign(VALUE=pd.to_numeric(chunk['VALUE'], errors='coerce'))
+                chunk = chunk.dropna(subset=['PATIENT', 'CODE', 'VALUE'])
+                partials.append(self._latest_per_patient_code(chunk[['DATE', 'PATIENT', 'CODE', 'VALUE']]))
+        except Exception as e:
+            self.logger.error(f"Error parsing {csv_file}: {str(e)}")
+            return empty
+
+        if not partials:
+            return empty
+        latest = self._latest_per_patient_code(pd.concat(partials, ignore_index=True))
+        return latest[['PATIENT', 'CODE', 'VALUE']]
+
+    def _latest_per_patient_code(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.sort_values('DATE', kind='stable')
+        return df.drop_duplicates(subset=['PATIENT', 'CODE'], keep='last')
+
+    def _read_csv_chunked(self, csv_file: Path, usecols: List[str], dtype: Dict[str, Any]) -> pd.DataFrame:
+        chunks = pd.read_csv(csv_file, usecols=usecols, dtype=dtype, chunksize=self.chunksize)
+        return pd.concat(chunks, ignore_index=True)
+
+    def _calculate_ages(self, birthdates: pd.Series, deathdates: pd.Series) -> pd.Series:
+        """Vectorized counterpart of _calculate_age."""
+        return calculate_ages(birthdates, deathdates)
+
     def _calculate_age(self, birthdate: pd.Timestamp, deathdate: Optional[pd.Timestamp] = None) -> int:
         end_date = deathdate if deathdate else pd.Timestamp.now()
         age = end_date.year - birthdate.year
@@ -71,8 +238,5 @@ class PatientDataLoader:
     def get_patients_dataframe(self) -> pd.DataFrame:
         if not self.patients_data:
             raise ValueError("Patient data has not been loaded.")
-        
-        df = pd.DataFrame.from_dict(self.patients_data, orient='index')
-        df.reset_index(inplace=True)
-        df.rename(columns={'index': 'patient_id'}, inplace=True)
-        return df
\ No newline at end of file
+
+        return self.store.to_dataframe()
\ No newline at end of file
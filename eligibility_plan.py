@@ -0,0 +1,207 @@
+# src/eligibility_plan.py
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Any, Iterable, Mapping, Optional, Tuple
+from src.patient_store import PatientStore
+from src.trial_index import ConditionMatchTable, DEFAULT_MIN_AGE, DEFAULT_MAX_AGE
+from src.exclusion_index import ExclusionIndex
+from src.lab_criteria import LabCriteriaIndex
+from src.match_record import MatchRecord
+
+# Every check a pair can be rejected by, as reported in the rejection counts
+CHECK_ORDER = ('age', 'gender', 'condition', 'exclusion', 'lab')
+# Checks left after TrialIndex.candidates, which applies age, gender and
+# condition to all trials at once; only these are evaluated per plan.
+RESIDUAL_CHECKS = ('exclusion', 'lab')
+
+# Relative per-pair cost of each residual check. Both are lookups into
+# per-patient masks that are only built the first time a patient needs them;
+# the exclusion mask scans every code the patient has, so it costs more.
+CHECK_COSTS = {
+    'exclusion': 4.0,
+    'lab': 3.0,
+}
+
+
+class PatientContext:
+    """Per-patient inputs shared by every plan evaluated for that patient."""
+
+    __slots__ = ('patient', 'age', 'gender', 'matched_conditions', 'row',
+                 '_exclusion_index', '_lab_index', '_excluded', '_lab_rejected')
+
+    def __init__(self, patient: Mapping[str, Any], condition_table: ConditionMatchTable,
+                 exclusion_index: ExclusionIndex, lab_index: LabCriteriaIndex,
+                 matched_conditions: Optional[np.ndarray] = None):
+        self.patient = patient
+        self.age = patient['age']
+        gender = patient['gender']
+        self.gender = gender.lower() if gender is not None else None
+        if matched_conditions is None:
+            matched_conditions = condition_table.matched_conditions(patient['condition_codes'])
+        self.matched_conditions = matched_conditions
+        self.row = getattr(patient, 'row', None)
+        self._exclusion_index = exclusion_index
+        self._lab_index = lab_index
+        self._excluded = None
+        self._lab_rejected = None
+
+    @property
+    def excluded(self) -> np.ndarray:
+        if self._excluded is None:
+            self._excluded = self._exclusion_index.excluded_mask(
+                list(self.patient['condition_codes']) + list(self.patient['medication_codes'])
+            )
+        return self._excluded
+
+    @property
+    def lab_rejected(self) -> np.ndarray:
+        if self._lab_rejected is None:
+            if self.row is not None:
+                self._lab_rejected = self._lab_index.rejected_mask(self.row)
+            else:
+                self._lab_rejected = self._lab_index.rejected_mask_for(self.patient['recent_lab_results'])
+        return self._lab_rejected
+
+
+@dataclass(frozen=True)
+class EligibilityPlan:
+    """
+    Immutable, pre-normalized eligibility test for one trial.
+
+    Age, gender and condition are applied to every trial at once by
+    TrialIndex.candidates; residual_checks lists the remaining checks
+    (exclusion and lab) in the order they are evaluated, most selective per
+    unit of cost first. Evaluation order does not change the result, only
+    how quickly a non-matching pair is rejected.
+    """
+    position: int
+    trial_id: str
+    trial_name: str
+    min_age: float
+    max_age: float
+    min_age_label: Any
+    max_age_label: Any
+    gender: Optional[str]
+    condition_ids: np.ndarray
+    lab_ranges: Tuple[Tuple[str, float, float], ...]
+    residual_checks: Tuple[str, ...]
+    # 1.0 for a single-age trial down to 0.0 for an open age range
+    age_tightness: float = 0.0
+
+    @property
+    def max_score(self) -> Tuple[int, float, float]:
+        """Upper bound of score() over every patient this plan can accept."""
+        return 3 + len(self.condition_ids) + len(self.lab_ranges), 1.0, self.age_tightness
+
+    def score(self, record: MatchRecord) -> Tuple[int, float, float]:
+        """
+        Rank of an accepted pair, compared as a tuple: criteria met, then the
+        share of the trial's conditions the patient matches (condition
+        specificity), then how tight the trial's age range is.
+        """
+        n_conditions = len(self.condition_ids)
+        specificity = len(record.conditions) / n_conditions if n_conditions else 0.0
+        return record.criteria_count, specificity, self.age_tightness
+
+    def accepts(self, context: PatientContext) -> bool:
+        """Whether a candidate from TrialIndex.candidates passes the residual checks."""
+        return self.rejecting_check(context) is None
+
+    def rejecting_check(self, context: PatientContext) -> Optional[str]:
+        """Name of the first residual check, in evaluation order, that rejects the candidate; None if all pass."""
+        for check in self.residual_checks:
+            if not _CHECKS[check](self, context):
+                return check
+        return None
+
+
+def _check_exclusion(plan: EligibilityPlan, context: PatientContext) -> bool:
+    return not context.excluded[plan.position]
+
+
+def _check_lab(plan: EligibilityPlan, context: PatientContext) -> bool:
+    return not plan.lab_ranges or not context.lab_rejected[plan.position]
+
+
+_CHECKS = {
+    'exclusion': _check_exclusion,
+    'lab': _check_lab,
+}
+
+
+class SelectivityEstimator:
+    """
+    Estimates, per trial, the fraction of the cohort each residual check
+    rejects. Lab rates are exact counts over the store; exclusion rates use
+    per-code patient frequencies with a union bound, so they can overestimate
+    how many patients a multi-code trial excludes.
+    """
+
+    def __init__(self, store: PatientStore, exclusion_index: ExclusionIndex, lab_index: LabCriteriaIndex):
+        self.n_patients = max(len(store), 1)
+        vocabulary = store.vocabulary
+        condition_freq = self._patients_per_code(store.condition_offsets, store.condition_values, len(vocabulary))
+        medication_freq = self._patients_per_code(store.medication_offsets, store.medication_values, len(vocabulary))
+
+        # Patients excluded by each trial
+        self.exclusion_reach = np.zeros(exclusion_index.n_trials, dtype=np.float64)
+        for code_id, code in enumerate(vocabulary):
+            freq = condition_freq[code_id] + medication_freq[code_id]
+            if freq:
+                self.exclusion_reach[exclusion_index.excluded_trials(code)] += freq
+
+        self.lab_rejected = np.zeros(lab_index.n_trials, dtype=np.float64)
+        self.lab_rejected[lab_index.lab_positions] = lab_index.rejected_counts
+
+    @staticmethod
+    def _patients_per_code(offsets: np.ndarray, values: np.ndarray, n_codes: int) -> np.ndarray:
+        rows = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+        pairs = np.unique(rows * max(n_codes, 1) + np.asarray(values, dtype=np.int64))
+        return np.bincount(pairs % max(n_codes, 1), minlength=n_codes)
+
+    def rejection_rates(self, position: int) -> Dict[str, float]:
+        n = self.n_patients
+        return {
+            'exclusion': min(self.exclusion_reach[position] / n, 1.0),
+            'lab': self.lab_rejected[position] / n,
+        }
+
+
+def age_tightness(min_age: float, max_age: float) -> float:
+    span = (max_age - min_age) / (DEFAULT_MAX_AGE - DEFAULT_MIN_AGE)
+    return min(max(1.0 - span, 0.0), 1.0)
+
+
+def order_checks(rejection_rates: Dict[str, float]) -> Tuple[str, ...]:
+    """Most rejections per unit of cost first; ties keep the canonical order."""
+    return tuple(sorted(
+        RESIDUAL_CHECKS,
+        key=lambda check: (-rejection_rates[check] / CHECK_COSTS[check], RESIDUAL_CHECKS.index(check)),
+    ))
+
+
+def compile_plans(trials: List[Dict[str, Any]], store: PatientStore,
+                  condition_table: ConditionMatchTable, exclusion_index: ExclusionIndex,
+                  lab_index: LabCriteriaIndex) -> List[EligibilityPlan]:
+    estimator = SelectivityEstimator(store, exclusion_index, lab_index)
+    plans = []
+    for position, trial in enumerate(trials):
+        min_age = trial.get('minimum_age')
+        max_age = trial.get('maximum_age')
+        gender = trial.get('gender') or 'All'
+        fields = {
+            'position': position,
+            'trial_id': trial['trial_id'],
+            'trial_name': trial['trial_name'],
+            'min_age': DEFAULT_MIN_AGE if min_age is None else min_age,
+            'max_age': DEFAULT_MAX_AGE if max_age is None else max_age,
+            'min_age_label': min_age,
+            'max_age_label': max_age,
+            'gender': None if gender == 'All' else gender.lower(),
+            'condition_ids': condition_table.trial_condition_ids[position],
+            'lab_ranges': tuple((code, low, high) for code, (low, high) in lab_index.criteria[position].items()),
+        }
+        fields['age_tightness'] = age_tightness(fields['min_age'], fields['max_age'])
+        residual_checks = order_checks(estimator.rejection_rates(position))
+        plans.append(EligibilityPlan(residual_checks=residual_checks, **fields))
+    return plans
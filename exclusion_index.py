@@ -0,0 +1,117 @@
+# src/exclusion_index.py
+import numpy as np
+from collections import deque
+from typing import Dict, List, Any, Iterable, Set
+from src.bounded_cache import BoundedCache
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton: one pass over a text finds every pattern it contains."""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._output[node].append(pattern_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def search(self, text: str) -> Set[int]:
+        """Ids of all patterns that occur anywhere in text."""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class ExclusionIndex:
+    """
+    Precomputed "code -> excluded trials" table.
+
+    A patient code excludes a trial when it occurs (case-insensitively) as a
+    substring of any of the trial's exclusion criteria, exactly as in
+    TrialMatcher._check_exclusion_criteria. The whole code vocabulary is
+    compiled into one Aho-Corasick automaton and each trial's exclusion text
+    is scanned once. Codes outside the vocabulary are resolved on use and
+    kept in an LRU cache of EXTRA_CODES entries, so ad-hoc patient records
+    cannot grow the table without bound.
+    """
+
+    EXTRA_CODES = 4096
+
+    def __init__(self, trials: List[Dict[str, Any]], vocabulary: Iterable[str]):
+        self.n_trials = len(trials)
+        self._criteria = [
+            [criterion.lower() for criterion in trial.get('exclusion_criteria') or []]
+            for trial in trials
+        ]
+
+        patterns = sorted({code.lower() for code in vocabulary if code})
+        automaton = AhoCorasick(patterns)
+        hits: List[List[int]] = [[] for _ in patterns]
+        self._trial_patterns: List[List[str]] = []
+        for position, criteria in enumerate(self._criteria):
+            found = set()
+            for criterion in criteria:
+                found |= automaton.search(criterion)
+            for pattern_id in found:
+                hits[pattern_id].append(position)
+            self._trial_patterns.append(sorted(patterns[pattern_id] for pattern_id in found))
+
+        self._excluded_trials = {
+            pattern: np.array(positions, dtype=np.int64)
+            for pattern, positions in zip(patterns, hits)
+        }
+        self._extra_excluded_trials: BoundedCache[str, np.ndarray] = BoundedCache(self.EXTRA_CODES)
+
+    def excluded_trials(self, code: str) -> np.ndarray:
+        key = code.lower()
+        positions = self._excluded_trials.get(key)
+        if positions is not None:
+            return positions
+        return self._extra_excluded_trials.get(key, self._scan_criteria)
+
+    def _scan_criteria(self, key: str) -> np.ndarray:
+        return np.array(
+            [p for p, criteria in enumerate(self._criteria) if any(key in c for c in criteria)],
+            dtype=np.int64,
+        )
+
+    def excluding_codes(self, position: int) -> List[str]:
+        """Lowercased vocabulary codes that exclude the trial at position."""
+        return self._trial_patterns[position]
+
+    def excluded_mask(self, codes: Iterable[str]) -> np.ndarray:
+        """Boolean mask over trial positions: True where any of the codes triggers an exclusion."""
+        mask = np.zeros(self.n_trials, dtype=bool)
+        for code in set(codes):
+            mask[self.excluded_trials(code)] = True
+        return mask
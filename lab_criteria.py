@@ -0,0 +1,175 @@
+# src/lab_criteria.py
+import re
+import numpy as np
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+from src.patient_store import PatientStore
+
+# Lab names as they appear in eligibility text -> LOINC codes used by Synthea.
+# Order matters: more specific names must come before names they contain.
+LAB_LOINC_CODES = [
+    (r'hba1c|hb\s?a1c|(?:hemoglobin|haemoglobin)\s+a1c|glycated\s+(?:hemoglobin|haemoglobin)|a1c', '4548-4'),
+    (r'(?:fasting\s+)?(?:plasma\s+)?glucose', '2339-0'),
+    (r'egfr|estimated\s+glomerular\s+filtration\s+rate', '33914-3'),
+    (r'(?:serum\s+)?creatinine(?!\s+clearance)', '38483-4'),
+    (r'ldl(?:[\s-]+c(?:holesterol)?)?|low[\s-]density\s+lipoprotein', '18262-6'),
+    (r'hdl(?:[\s-]+c(?:holesterol)?)?|high[\s-]density\s+lipoprotein', '2085-9'),
+    (r'total\s+cholesterol', '2093-3'),
+    (r'triglycerides?', '2571-8'),
+    (r'hemoglobin|haemoglobin', '718-7'),
+    (r'platelets?(?:\s+count)?', '777-3'),
+    (r'potassium', '6298-4'),
+    (r'sodium', '2947-0'),
+    (r'bmi|body\s+mass\s+index', '39156-5'),
+    (r'systolic\s+(?:blood\s+pressure|bp)|sbp', '8480-6'),
+    (r'diastolic\s+(?:blood\s+pressure|bp)|dbp', '8462-4'),
+]
+
+_LAB_NAME_PATTERN = re.compile(
+    '|'.join(f'(?P<lab{i}>\\b(?:{pattern})\\b)' for i, (pattern, _) in enumerate(LAB_LOINC_CODES)),
+    re.IGNORECASE,
+)
+_NUMBER = r'(\d+(?:\.\d+)?)'
+_UNIT = r'(?:\s*(?:%|[a-zA-Z/µ]+(?:/[\w.]+)*))?'
+# Words allowed between a lab name and its predicate, e.g. "HbA1c level of", "LDL (mg/dL) must be"
+_LEAD = re.compile(
+    r'[\s:,]*(?:\([^)]*\)[\s:,]*)?'
+    r'(?:(?:levels?|values?|count|concentration|of|must|should|be|is|are|needs?\s+to\s+be)\b[\s:,]*)*',
+    re.IGNORECASE,
+)
+_RANGE = re.compile(
+    rf'(?:between\s+{_NUMBER}{_UNIT}\s+and\s+{_NUMBER})|(?:(?:from\s+)?{_NUMBER}{_UNIT}\s*(?:-|–|to)\s*{_NUMBER})',
+    re.IGNORECASE,
+)
+_LOWER_OPS = (r'>=|≥|=>|>|greater\s+than(?:\s+or\s+equal\s+to)?|more\s+than|higher\s+than|at\s+least'
+              r'|above|over|exceed(?:s|ing)?')
+_UPPER_OPS = (r'<=|≤|=<|<|less\s+than(?:\s+or\s+equal\s+to)?|lower\s+than|at\s+most|up\s+to'
+              r'|below|under')
+# A negated comparison bounds the other side: "no more than 10" is an upper bound
+_COMPARISON = re.compile(
+    rf'(?P<negated>(?:not|no)\s+(?:to\s+|be\s+)?)?(?:(?P<lower>{_LOWER_OPS})|(?P<upper>{_UPPER_OPS}))'
+    rf'\s*(?P<value>\d+(?:\.\d+)?){_UNIT}',
+    re.IGNORECASE,
+)
+_CONNECTOR = re.compile(r'\s*(?:,|and\b|but\b)?\s*', re.IGNORECASE)
+
+
+def parse_lab_criteria(inclusion_criteria: List[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Extract lab range predicates from inclusion criteria lines, e.g.
+    "HbA1c between 7.0 and 10.5%", "eGFR >= 30 mL/min" or "Hemoglobin no
+    more than 10 g/dL". The predicate must directly follow the lab name, so
+    numbers later in the line ("at visit 1-2") are not read as bounds.
+    Returns {loinc_code: (min_value, max_value)}; an open side is +/-inf.
+    Strict and non-strict comparisons are both treated as inclusive bounds.
+    """
+    lab_criteria: Dict[str, Tuple[float, float]] = {}
+
+    for criterion in inclusion_criteria:
+        names = list(_LAB_NAME_PATTERN.finditer(criterion))
+        for i, name in enumerate(names):
+            # The predicate for a lab is the text up to the next lab name
+            end = names[i + 1].start() if i + 1 < len(names) else len(criterion)
+            bounds = _parse_bounds(criterion[name.end():end])
+            if bounds is None:
+                continue
+            lab_code = LAB_LOINC_CODES[int(name.lastgroup[3:])][1]
+            low, high = lab_criteria.get(lab_code, (-np.inf, np.inf))
+            lab_criteria[lab_code] = (max(low, bounds[0]), min(high, bounds[1]))
+
+    return lab_criteria
+
+
+def parse_trial_lab_criteria(trials: List[Dict[str, Any]]) -> List[Dict[str, Tuple[float, float]]]:
+    """parse_lab_criteria for each trial's inclusion criteria, in trial order."""
+    return [parse_lab_criteria(trial.get('inclusion_criteria') or []) for trial in trials]
+
+
+def _parse_bounds(text: str) -> Optional[Tuple[float, float]]:
+    start = _LEAD.match(text).end()
+    match = _RANGE.match(text, start)
+    if match:
+        values = [float(v) for v in match.groups() if v is not None]
+        return min(values), max(values)
+
+    # One or more comparisons, e.g. "> 30 and <= 90 mL/min"
+    low, high = -np.inf, np.inf
+    comparison = _COMPARISON.match(text, start)
+    if comparison is None:
+        return None
+    while comparison is not None:
+        value = float(comparison.group('value'))
+        if (comparison.group('lower') is None) == (comparison.group('negated') is None):
+            high = min(high, value)
+        else:
+            low = max(low, value)
+        comparison = _COMPARISON.match(text, _CONNECTOR.match(text, comparison.end()).end())
+    return low, high
+
+
+class LabCriteriaIndex:
+    """
+    Lab predicates for one batch of trials, evaluated against the whole cohort.
+
+    Each trial's inclusion criteria are parsed once; cohorts that share
+    CompiledTrials pass the already parsed criteria instead. For every trial
+    with lab predicates, the patients whose latest value falls outside a
+    required range are found with NumPy comparisons over the store's lab
+    columns.
+    Rejections are sparse (a trial only rejects patients measured for its
+    labs), so they are kept as sorted patient rows per lab trial, and the
+    same pairs transposed into lab trial positions per patient row; both are
+    CSR arrays like the store's code lists. Patients with no value for a lab
+    are not rejected by it.
+    """
+
+    def __init__(self, trials: List[Dict[str, Any]], store: PatientStore,
+                 criteria: Optional[List[Dict[str, Tuple[float, float]]]] = None):
+        self.n_trials = len(trials)
+        if criteria is None:
+            criteria = parse_trial_lab_criteria(trials)
+        self.criteria = criteria
+        self.lab_positions = np.array([p for p, c in enumerate(self.criteria) if c], dtype=np.int64)
+
+        n_patients = len(store)
+        rejected_rows = []
+        for position in self.lab_positions:
+            rows = []
+            for lab_code, (min_value, max_value) in self.criteria[position].items():
+                lab_rows, values = store.lab_column(lab_code)
+                rows.append(lab_rows[(values < min_value) | (values > max_value)])
+            rejected_rows.append(np.unique(np.concatenate(rows)).astype(np.int32))
+        self.rejected_counts = np.array([len(rows) for rows in rejected_rows], dtype=np.int64)
+        self._trial_offsets = np.zeros(len(self.lab_positions) + 1, dtype=np.int64)
+        np.cumsum(self.rejected_counts, out=self._trial_offsets[1:])
+        self._trial_rows = np.concatenate(rejected_rows) if rejected_rows else np.zeros(0, dtype=np.int32)
+
+        # Transpose: patient row -> positions of the lab trials that reject it, in position order
+        trials_of_pairs = np.repeat(self.lab_positions, self.rejected_counts)
+        order = np.argsort(self._trial_rows, kind='stable')
+        self._patient_offsets = np.zeros(n_patients + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._trial_rows, minlength=n_patients), out=self._patient_offsets[1:])
+        self._patient_positions = trials_of_pairs[order]
+
+    def rejected_mask(self, row: int) -> np.ndarray:
+        """Boolean mask over trial positions whose lab ranges the patient at row fails."""
+        mask = np.zeros(self.n_trials, dtype=bool)
+        mask[self._patient_positions[self._patient_offsets[row]:self._patient_offsets[row + 1]]] = True
+        return mask
+
+    def rejected_patients(self, position: int, n_patients: int) -> np.ndarray:
+        """Boolean mask over patient rows whose lab values fail the trial at position."""
+        mask = np.zeros(n_patients, dtype=bool)
+        i = np.searchsorted(self.lab_positions, position)
+        if i < len(self.lab_positions) and self.lab_positions[i] == position:
+            mask[self._trial_rows[self._trial_offsets[i]:self._trial_offsets[i + 1]]] = True
+        return mask
+
+    def rejected_mask_for(self, patient_labs: Mapping[str, float]) -> np.ndarray:
+        """Same as rejected_mask, for a patient that is not in the store."""
+        mask = np.zeros(self.n_trials, dtype=bool)
+        for position in self.lab_positions:
+            for lab_code, (min_value, max_value) in self.criteria[position].items():
+                if lab_code in patient_labs and not min_value <= patient_labs[lab_code] <= max_value:
+                    mask[position] = True
+                    break
+        return mask
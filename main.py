@@ -1,13 +1,18 @@
+import json
 import logging
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Tuple, Optional, Dict, Any
-from dataclasses import dataclass
-from data_loader import PatientDataLoader
+from typing import Tuple, Optional, Dict, Any, Iterable, Iterator, List, Mapping, Sequence
+from dataclasses import dataclass, replace
+from datetime import datetime
 from src.data_loader import PatientDataLoader
 from src.output import OutputGenerator
 from src.matcher import TrialMatcher
+from src.metrics import PipelineMetrics
+from src.trial_index import CompiledTrials
 from src.trial_scraper import TrialScraper
 
 @dataclass
@@ -16,20 +21,76 @@ class PipelineConfig:
     output_dir: str
     #criteria_file: str
     config_file: Optional[str] = None
+    cache_dir: Optional[str] = None
+    trial_cache_path: Optional[str] = None
+    trial_cache_ttl_hours: float = 24.0
+    offline: bool = False
+    workers: Optional[int] = 1
+    chunk_size: int = 1000
+    # Incremental matching: reuse the previous run's matches saved at this path. It holds
+    # every match in memory to save them, so it is off unless a path is set.
+    match_state_path: Optional[str] = None
+    output_formats: Tuple[str, ...] = ('json', 'excel')
     dry_run: bool = False
+    # Keep only the k best-ranked eligible trials per patient; None keeps all
+    top_k: Optional[int] = None
+    # Run the matching stage under cProfile and save the stats next to the outputs
+    profile_match: bool = False
+
+
+def trial_scraper_for(config: PipelineConfig) -> TrialScraper:
+    return TrialScraper(
+        cache_path=config.trial_cache_path,
+        ttl_hours=config.trial_cache_ttl_hours,
+        offline=config.offline,
+    )
 
 
-        
 class MatchingPipeline: 
     def __init__(self, config: PipelineConfig):
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.setup_logging()
+        # Filled in by run()
+        self.summary: Dict[str, Any] = {}
+        self.metrics: Optional[PipelineMetrics] = None
 
     def setup_logging(verbose: bool = False):
         level = logging.DEBUG if verbose else logging.INFO
         logging.basicConfig(level=level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+    def _log_summary(self, counts: Dict[str, int]) -> None:
+        stats = self._summary_stats(counts['total_patients'], counts['matched_patients'])
+        self.logger.info("Matching Summary:")
+        for key, value in stats.items():
+            self.logger.info(f"  {key}: {value}")
+
+    def _log_metrics(self, metrics: PipelineMetrics) -> None:
+        self.logger.info("Stage timings:")
+        for name, stage in metrics.stages.items():
+            peak = f"{stage['peak_rss_mb']:.1f} MB" if stage['peak_rss_mb'] is not None else "n/a"
+            self.logger.info(
+                f"  {name}: {stage['wall_seconds']:.2f}s wall, {stage['cpu_seconds']:.2f}s CPU, peak RSS {peak}"
+            )
+        self.logger.info(f"  rejections: {metrics.counters['rejections']}")
+
+    def _save_metrics(self, metrics: PipelineMetrics, trial_matcher: TrialMatcher,
+                      counts: Dict[str, int], timestamp: str) -> None:
+        self.summary = self._summary_stats(counts['total_patients'], counts['matched_patients'])
+        metrics.counters.update(
+            counts,
+            pairs_evaluated=trial_matcher.pairs_evaluated,
+            rejections=dict(trial_matcher.rejections),
+            matches=trial_matcher.pairs_evaluated - sum(trial_matcher.rejections.values()),
+        )
+        output_path = Path(self.config.output_dir)
+        metrics_path = metrics.save(output_path / f'trial_matches_{timestamp}_metrics.json')
+        self.logger.info(f"Metrics saved to {metrics_path}")
+        profile_path = metrics.save_profile(output_path / f'trial_matches_{timestamp}_match.prof')
+        if profile_path:
+            self.logger.info(f"Match profile saved to {profile_path}")
+        self._log_metrics(metrics)
+
     def validate_directories(self) -> None:
         
         self.logger.info("Validating directories...")
@@ -55,52 +116,78 @@ class MatchingPipeline:
     
 
     def generate_summary_stats(self, matches: Dict[str, Any]) -> Dict[str, Any]:
+        return self._summary_stats(len(matches), sum(1 for m in matches.values() if m))
+
+    def _summary_stats(self, total_patients: int, matched_patients: int) -> Dict[str, Any]:
         return {
-            'total_patients': len(matches),
-            'matched_patients': sum(1 for m in matches.values() if m),
-            'match_rate': f"{(sum(1 for m in matches.values() if m) / len(matches)) * 100:.1f}%"
+            'total_patients': total_patients,
+            'matched_patients': matched_patients,
+            'match_rate': f"{(matched_patients / total_patients if total_patients else 0) * 100:.1f}%"
         }
 
-    def run(self) -> Tuple[Optional[Path], Optional[Path]]:
+    def _count_matches(self, results: Iterable[Tuple[str, List[Mapping]]],
+                       counts: Dict[str, int]) -> Iterator[Tuple[str, List[Mapping]]]:
+        """Pass results through unchanged while counting them for the summary."""
+        for patient_id, eligible_trials in results:
+            counts['total_patients'] += 1
+            counts['matched_patients'] += bool(eligible_trials)
+            yield patient_id, eligible_trials
+
+    def run(self, compiled_trials: Optional[CompiledTrials] = None) -> Tuple[Optional[Path], Optional[Path]]:
+        """compiled_trials, when given, replaces fetching and indexing trials for this run."""
         start_time = time.time()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        metrics = PipelineMetrics(profile=self.config.profile_match)
+        self.metrics = metrics
         self.logger.info("Starting clinical trial matching pipeline...")
         
         try:
             self.validate_directories()
             self.logger.info("Initializing pipeline components...")
-            patient_loader = PatientDataLoader(self.config.data_dir)
-            trial_scraper = TrialScraper()
+            with metrics.stage('load'):
+                patient_loader = PatientDataLoader(self.config.data_dir, cache_dir=self.config.cache_dir)
+            trial_scraper = None if compiled_trials is not None else trial_scraper_for(self.config)
             
             trial_matcher = TrialMatcher(
                 patient_loader=patient_loader,
                 trial_scraper=trial_scraper,
+                workers=self.config.workers,
+                chunk_size=self.config.chunk_size,
+                state_path=self.config.match_state_path,
+                metrics=metrics,
+                compiled_trials=compiled_trials,
+                top_k=self.config.top_k,
             )
            
             self.logger.info(f"Processing {len(patient_loader.patients_data)} patient records...")
-            matches = trial_matcher.match_all_patients()
-            
-            
-            stats = self.generate_summary_stats(matches)
-            self.logger.info("Matching Summary:")
-            for key, value in stats.items():
-                self.logger.info(f"  {key}: {value}")
-            
+            # Results stream from the matcher straight into the output writers,
+            # so match time is only the time spent producing each result
+            counts = {'total_patients': 0, 'matched_patients': 0}
+            results = self._count_matches(trial_matcher.iter_matches(), counts)
+
             if self.config.dry_run:
+                with metrics.stage('match'), metrics.profiled():
+                    for _ in results:
+                        pass
+                self._log_summary(counts)
+                self._save_metrics(metrics, trial_matcher, counts, timestamp)
                 self.logger.info("Dry run completed successfully")
                 return None, None
          
-            output_generator = OutputGenerator(self.config.output_dir)
-            json_path, excel_path = output_generator.generate_outputs(matches)
+            output_generator = OutputGenerator(self.config.output_dir, self.config.output_formats)
+            with metrics.stage('output', nested=('match',)):
+                paths = output_generator.write(metrics.timed_iter('match', results, profile=True), timestamp)
+            self._log_summary(counts)
+            self._save_metrics(metrics, trial_matcher, counts, timestamp)
             
             execution_time = time.time() - start_time
             self.logger.info(
                 f"Pipeline completed in {execution_time:.2f} seconds\n"
-                f"Results saved to:\n"
-                f"  JSON: {json_path}\n"
-                f"  Excel: {excel_path}"
+                f"Results saved to:\n" +
+                "\n".join(f"  {output_format.upper()}: {path}" for output_format, path in paths.items())
             )
             
-            return json_path, excel_path
+            return paths.get('json'), paths.get('excel')
             
         except Exception as e:
             self.logger.error(f"Pipeline failed: {str(e)}", exc_info=True)
@@ -108,11 +195,142 @@ class MatchingPipeline:
     
     
 
+# Trials shared with cohort worker processes, set in the parent before the
+# pool starts so forked workers inherit them (see matcher._WORKER_MATCHER).
+_BATCH_TRIALS = None
+
+
+def _init_cohort_worker(compiled_trials: Optional[CompiledTrials]) -> None:
+    global _BATCH_TRIALS
+    if compiled_trials is not None:
+        _BATCH_TRIALS = compiled_trials
+
+
+def _run_cohort(name: str, config: PipelineConfig) -> Dict[str, Any]:
+    result = {'cohort': name, 'data_dir': config.data_dir, 'output_dir': config.output_dir}
+    pipeline = MatchingPipeline(config)
+    try:
+        json_path, excel_path = pipeline.run(_BATCH_TRIALS)
+    except Exception as e:
+        # The pipeline already logged the traceback; the other cohorts still run
+        result['error'] = str(e)
+        return result
+    result.update(
+        json=str(json_path) if json_path else None,
+        excel=str(excel_path) if excel_path else None,
+        summary=pipeline.summary,
+        metrics=pipeline.metrics.to_dict(),
+    )
+    return result
+
+
+class MultiCohortPipeline:
+    """
+    Match several cohorts against one trial fetch. Trials are fetched and
+    compiled once (CompiledTrials); each cohort then runs as a normal
+    MatchingPipeline with its own outputs, metrics and match state under
+    output_dir/<cohort name>, either back to back or cohort_workers at a
+    time in separate processes.
+
+    cohort_dirs defaults to every subdirectory of config.data_dir that holds
+    CSV files. With cohort_workers > 1 each cohort is matched in a single
+    process, so cohorts are not also split over config.workers.
+    """
+
+    def __init__(self, config: PipelineConfig, cohort_dirs: Optional[Sequence[str]] = None,
+                 cohort_workers: int = 1):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        if cohort_dirs is None:
+            cohort_dirs = sorted(str(path) for path in Path(config.data_dir).iterdir()
+                                 if path.is_dir() and any(path.glob('*.csv')))
+        self.cohort_dirs = list(cohort_dirs)
+        self.cohort_workers = max(cohort_workers, 1)
+
+    def _cohort_configs(self) -> Dict[str, PipelineConfig]:
+        configs = {}
+        for cohort_dir in self.cohort_dirs:
+            name = base = Path(cohort_dir).name
+            suffix = 2
+            while name in configs:
+                name = f'{base}_{suffix}'
+                suffix += 1
+            state_path = self.config.match_state_path
+            if state_path:
+                state_path = Path(state_path)
+                state_path = str(state_path.with_name(f'{state_path.stem}_{name}{state_path.suffix}'))
+            configs[name] = replace(
+                self.config,
+                data_dir=cohort_dir,
+                output_dir=str(Path(self.config.output_dir) / name),
+                match_state_path=state_path,
+                workers=1 if self.cohort_workers > 1 else self.config.workers,
+            )
+        return configs
+
+    def run(self) -> Dict[str, Any]:
+        global _BATCH_TRIALS
+        if not self.cohort_dirs:
+            raise ValueError(f"No cohort directories to match under {self.config.data_dir}")
+        start_time = time.time()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        metrics = PipelineMetrics()
+        self.logger.info(f"Starting batch of {len(self.cohort_dirs)} cohorts...")
+
+        with metrics.stage('fetch'):
+            trials = trial_scraper_for(self.config).get_active_trials()
+        with metrics.stage('index'):
+            compiled_trials = CompiledTrials(trials)
+        self.logger.info(f"Compiled {len(compiled_trials)} trials for all cohorts")
+
+        configs = self._cohort_configs()
+        _BATCH_TRIALS = compiled_trials
+        try:
+            if self.cohort_workers > 1 and len(configs) > 1:
+                if 'fork' in multiprocessing.get_all_start_methods():
+                    context, initargs = multiprocessing.get_context('fork'), (None,)
+                else:
+                    context, initargs = multiprocessing.get_context(), (compiled_trials,)
+                with ProcessPoolExecutor(min(self.cohort_workers, len(configs)), mp_context=context,
+                                         initializer=_init_cohort_worker, initargs=initargs) as executor:
+                    cohorts = list(executor.map(_run_cohort, configs.keys(), configs.values()))
+            else:
+                cohorts = [_run_cohort(name, config) for name, config in configs.items()]
+        finally:
+            _BATCH_TRIALS = None
+
+        failed = [cohort['cohort'] for cohort in cohorts if 'error' in cohort]
+        report = {
+            'trials': len(compiled_trials),
+            'shared_stages': metrics.stages,
+            'wall_seconds': time.time() - start_time,
+            'cohorts': cohorts,
+        }
+        output_path = Path(self.config.output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        report_path = output_path / f'batch_summary_{timestamp}.json'
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for cohort in cohorts:
+            if 'error' in cohort:
+                self.logger.error(f"  {cohort['cohort']}: failed: {cohort['error']}")
+            else:
+                self.logger.info(f"  {cohort['cohort']}: {cohort['summary']}")
+        self.logger.info(
+            f"Batch of {len(cohorts)} cohorts completed in {report['wall_seconds']:.2f} seconds"
+            f"{f' ({len(failed)} failed)' if failed else ''}; summary saved to {report_path}"
+        )
+        return report
+
+
 def main():
     try:
         config = PipelineConfig(
             data_dir="/Users/jeevikapawar/Documents/clinical_trial_matcher/data/raw/synthea_sample_data_csv_latest",
             output_dir="/Users/jeevikapawar/Documents/clinical_trial_matcher/data/processed",
+            cache_dir="/Users/jeevikapawar/Documents/clinical_trial_matcher/data/cache",
+            trial_cache_path="/Users/jeevikapawar/Documents/clinical_trial_matcher/data/cache/trials.json",
             #criteria_file="/Users/jeevikapawar/Documents/Clinical Trial Matcher/config/criteria.json"
         )
         
@@ -0,0 +1,93 @@
+# src/match_record.py
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Optional, Tuple
+
+# Criterion ids, in the order their explanations are listed
+CRITERION_AGE = 'age'
+CRITERION_GENDER = 'gender'
+CRITERION_CONDITION = 'condition'
+CRITERION_EXCLUSION = 'exclusion'
+CRITERION_LAB = 'lab'
+
+
+class MatchRecord(Mapping):
+    """
+    One eligible patient/trial pair, stored as the values its criteria were
+    checked on rather than as text.
+
+    Reads like the {'trialId', 'trialName', 'eligibilityCriteriaMet'} dicts the
+    matcher used to produce; the eligibilityCriteriaMet strings are rendered
+    each time they are accessed. criteria_count needs no rendering.
+    """
+
+    __slots__ = ('trial_id', 'trial_name', 'age', 'gender', 'age_limits', 'conditions', 'labs')
+    KEYS = ('trialId', 'trialName', 'eligibilityCriteriaMet')
+
+    def __init__(self, trial_id: str, trial_name: str, age: int, gender: Optional[str],
+                 age_limits: Tuple[Any, Any], conditions: Tuple[str, ...],
+                 labs: Tuple[Tuple[str, float, float, float], ...] = ()):
+        self.trial_id = trial_id
+        self.trial_name = trial_name
+        self.age = age
+        self.gender = gender
+        # Trial age limits as published, None for an open bound
+        self.age_limits = age_limits
+        # Matched trial conditions, lowercased
+        self.conditions = conditions
+        # (lab_code, patient value, min_value, max_value) for each checked lab the patient has
+        self.labs = labs
+
+    @property
+    def criteria_count(self) -> int:
+        # age, gender and exclusion, plus one per matched condition and checked lab
+        return 3 + len(self.conditions) + len(self.labs)
+
+    def criteria(self) -> List[Tuple[str, tuple]]:
+        """(criterion id, values) for every criterion met, in explanation order."""
+        criteria = [(CRITERION_AGE, (self.age,) + tuple(self.age_limits)), (CRITERION_GENDER, (self.gender,))]
+        criteria.extend((CRITERION_CONDITION, (condition,)) for condition in self.conditions)
+        criteria.append((CRITERION_EXCLUSION, ()))
+        criteria.extend((CRITERION_LAB, lab) for lab in self.labs)
+        return criteria
+
+    def render_criteria(self) -> List[str]:
+        min_age, max_age = self.age_limits
+        criteria_met = [
+            f"Age {self.age} within trial limits: {min_age}-{max_age}",
+            f"Gender {self.gender} matches trial requirements",
+        ]
+        criteria_met.extend(f"Matches trial condition: {condition}" for condition in self.conditions)
+        criteria_met.append("No exclusion criteria violated")
+        criteria_met.extend(
+            f"Lab result {lab_code}: {value} within required range: {min_value}-{max_value}"
+            for lab_code, value, min_value, max_value in self.labs
+        )
+        return criteria_met
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'trialId':
+            return self.trial_id
+        if key == 'trialName':
+            return self.trial_name
+        if key == 'eligibilityCriteriaMet':
+            return self.render_criteria()
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __reduce__(self):
+        return (MatchRecord, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f"MatchRecord({self.trial_id!r}, criteria={self.criteria()!r})"
+
+
+def criteria_count(match: Mapping) -> int:
+    """Number of criteria met by a MatchRecord or a rendered match dict."""
+    if isinstance(match, MatchRecord):
+        return match.criteria_count
+    return len(match['eligibilityCriteriaMet'])
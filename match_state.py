@@ -0,0 +1,69 @@
+# src/match_state.py
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Any, Mapping, Optional
+
+# Bump when the matching logic changes so results from older runs are not reused.
+MATCH_STATE_VERSION = 1
+
+
+def trial_fingerprint(trial: Dict[str, Any]) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(json.dumps(trial, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MatchState:
+    """
+    Match results of the previous run plus the fingerprints they were computed
+    from, stored as one JSON file:
+
+        {"version": 1, "patients": {<patient id>: <fingerprint>},
+         "trials": {<trial id>: <fingerprint>}, "matches": {<patient id>: [...]}}
+
+    A patient's prior matches against a trial stay valid as long as neither
+    fingerprint changed, so the next run only has to evaluate changed rows and
+    changed columns of the patient x trial grid.
+    """
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable match state {self.path}: {str(e)}")
+            return None
+        if state.get('version') != MATCH_STATE_VERSION:
+            self.logger.info(f"Ignoring match state {self.path} from another matcher version")
+            return None
+        return state
+
+    def save(self, patients: Dict[str, str], trials: Dict[str, str],
+             matches: Dict[str, List[Mapping]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        state = {
+            'version': MATCH_STATE_VERSION,
+            'patients': patients,
+            'trials': trials,
+            # MatchRecords are stored rendered, in the output format
+            'matches': {patient_id: [dict(match) for match in eligible_trials]
+                        for patient_id, eligible_trials in matches.items()},
+        }
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write match state {self.path}: {str(e)}")
+            return
+        self.logger.info(f"Saved match state for {len(patients)} patients to {self.path}")
@@ -1,43 +1,356 @@
 # src/matcher.py
-from typing import Dict, List, Any, Optional
+import heapq
+import multiprocessing
+import os
+from typing import Dict, Iterator, List, Any, Mapping, Optional, Tuple
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from src.data_loader import PatientDataLoader
 from src.trial_scraper import TrialScraper
+from src.trial_index import TrialIndex, ConditionMatchTable, CompiledTrials, DEFAULT_MIN_AGE, DEFAULT_MAX_AGE
+from src.exclusion_index import ExclusionIndex
+from src.cohort_index import CohortIndex
+from src.lab_criteria import LabCriteriaIndex, parse_lab_criteria
+from src.eligibility_plan import CHECK_ORDER, EligibilityPlan, PatientContext, compile_plans
+from src.match_record import MatchRecord
+from src.match_state import MatchState, trial_fingerprint
+from src.metrics import PipelineMetrics
+from src.patient_store import PatientView
+
+# Matcher shared with pool workers. With the fork start method it is set in the
+# parent before the pool starts, so workers inherit the patient store, trials
+# and indexes copy-on-write instead of receiving them with every task.
+_WORKER_MATCHER = None
+
+
+def _init_worker(matcher: Optional['TrialMatcher']) -> None:
+    global _WORKER_MATCHER
+    if matcher is not None:
+        _WORKER_MATCHER = matcher
+
+
+def _match_chunk(task: Tuple[List[int], Optional[np.ndarray]]) -> Tuple[List[Tuple[str, List[Mapping]]], Dict[str, int], int]:
+    # Counters are per chunk; the parent adds them to its own
+    matcher = _WORKER_MATCHER
+    matcher.reset_counters()
+    results = matcher._match_rows(*task)
+    return results, matcher.rejections, matcher.pairs_evaluated
+
 
 class TrialMatcher:
-    def __init__(self, patient_loader: PatientDataLoader, trial_scraper: TrialScraper):
+    def __init__(self, patient_loader: PatientDataLoader, trial_scraper: TrialScraper,
+                 workers: Optional[int] = 1, chunk_size: int = 1000, state_path: Optional[str] = None,
+                 metrics: Optional[PipelineMetrics] = None, compiled_trials: Optional[CompiledTrials] = None,
+                 top_k: Optional[int] = None):
+        if top_k is not None and top_k < 1:
+            raise ValueError(f"top_k must be at least 1, got {top_k}")
+        if top_k is not None and state_path:
+            # Stored matches carry no scores and omit what was cut, so they cannot be re-ranked
+            raise ValueError("Ranked top-k matching cannot be combined with incremental matching (state_path)")
         self.patient_loader = patient_loader
         self.trial_scraper = trial_scraper
+        # Trials fetched and indexed once for several cohorts; trial_scraper is not used when given
+        self.compiled_trials = compiled_trials
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.state = MatchState(state_path) if state_path else None
+        # Keep only the top_k highest-scoring eligible trials per patient, best first
+        self.top_k = top_k
         self.matches = {}
+        self.patient_store = None
+        self.active_trials = []
+        self.condition_table = None
+        self.trial_index = None
+        self.exclusion_index = None
+        self.lab_index = None
+        self.plans = []
+        self.trial_positions = {}
+        self.bound_ranks = None
+        self.cohort_index = None
+        self.metrics = metrics or PipelineMetrics()
+        self.reset_counters()
 
-    def match_all_patients(self) -> Dict[str, List[Dict]]:
-        print("Initiating Matcher")
-        patients_df = self.patient_loader.get_patients_dataframe()
-        print(f"Loaded {len(patients_df)} patient records")
-        print("Fetching active trials")
-        active_trials = self.trial_scraper.get_active_trials()
-        print(f"Fetched {len(active_trials)} active trials")
-        print("Matcher looping through patients")
-        
-        for _, patient in patients_df.iterrows():
-            eligible_trials = []
-            
-            for trial in active_trials:
-                eligibility_criteria_met = self._check_eligibility(patient, trial)
-                
-                if eligibility_criteria_met:
-                    eligible_trials.append({
-                        'trialId': trial['trial_id'],
-                        'trialName': trial['trial_name'],
-                        'eligibilityCriteriaMet': eligibility_criteria_met
-                    })
-            
-            self.matches[patient['patient_id']] = eligible_trials
+    def reset_counters(self) -> None:
+        # Pairs rejected per check, each counted against the first check that
+        # rejected it; in ranked mode, 'top_k' counts the pairs ranked out or
+        # skipped by early termination
+        self.rejections = dict.fromkeys(CHECK_ORDER + (('top_k',) if self.top_k else ()), 0)
+        self.pairs_evaluated = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only what _match_rows needs travels to spawned workers
+        state = self.__dict__.copy()
+        state.update(patient_loader=None, trial_scraper=None, state=None, metrics=None, cohort_index=None, matches={})
+        return state
+
+    def match_all_patients(self) -> Dict[str, List[Mapping]]:
+        for patient_id, eligible_trials in self.iter_matches():
+            self.matches[patient_id] = eligible_trials
         print(f"Matching completed. {len(self.matches)} patients processed.")    
         return self.matches
 
-    def _check_eligibility(self, patient: pd.Series, trial: Dict) -> Optional[List[str]]:
+    def iter_matches(self) -> Iterator[Tuple[str, List[Mapping]]]:
+        """
+        Fetch trials and build the indexes now, then return an iterator of
+        (patient_id, eligible_trials) in patient row order that matches
+        patients as it is consumed, without keeping the results, so output can
+        be streamed. In incremental mode all results are still held until the
+        match state is saved.
+        """
+        self.prepare()
+        print("Matcher looping through patients")
+
+        self.reset_counters()
+        if self.state is not None:
+            return self._match_incremental()
+        return self._evaluate(range(len(self.patient_store)))
+
+    def prepare(self, active_trials: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Take the loaded patient store, fetch the active trials (unless given,
+        or taken from compiled_trials) and build the indexes and eligibility
+        plans that matching runs on.
+        """
+        print("Initiating Matcher")
+        self.patient_store = self.patient_loader.store
+        print(f"Loaded {len(self.patient_store)} patient records")
+        print("Fetching active trials")
+        with self.metrics.stage('fetch'):
+            if active_trials is None and self.compiled_trials is not None:
+                active_trials = self.compiled_trials.trials
+            elif active_trials is None:
+                active_trials = self.trial_scraper.get_active_trials()
+            self.active_trials = active_trials
+        print(f"Fetched {len(self.active_trials)} active trials")
+        with self.metrics.stage('index'):
+            self._build_indexes()
+
+    def match_patient(self, patient: Mapping[str, Any]) -> List[MatchRecord]:
+        """
+        Eligible trials for one patient, once prepare() has run. patient is a
+        row of the store (PatientView) or any mapping with the same fields,
+        such as an ad-hoc record that is not in the cohort.
+        """
+        return self._match_patient(patient)
+
+    def eligible_rows(self, trial_id: str) -> np.ndarray:
+        """
+        Store rows of every patient eligible for one trial, once prepare() has
+        run, evaluated against the whole cohort through the CohortIndex
+        (built on first use). Raises KeyError for an unknown trial.
+        """
+        plan = self.plans[self.trial_positions[trial_id]]
+        if self.cohort_index is None:
+            self.cohort_index = CohortIndex(self.patient_store)
+        return self.cohort_index.eligible_rows(plan, self.condition_table, self.exclusion_index, self.lab_index)
+
+    def eligible_patients(self, trial_id: str) -> List[str]:
+        return [self.patient_store.patient_id(row) for row in self.eligible_rows(trial_id)]
+
+    def _match_incremental(self) -> Iterator[Tuple[str, List[Mapping]]]:
+        """
+        Reuse the previous run's matches for every (patient, trial) pair whose
+        fingerprints are unchanged. Changed or new patients are matched against
+        all trials, unchanged patients only against changed or new trials, and
+        matches against trials that are gone are dropped.
+        """
+        patient_fingerprints = self.patient_store.fingerprints()
+        trial_fingerprints = [trial_fingerprint(trial) for trial in self.active_trials]
+        previous = self.state.load()
+        matches = {}
+
+        if previous is None:
+            print("No previous match state, matching all patients")
+            for patient_id, eligible_trials in self._evaluate(range(len(self.patient_store))):
+                matches[patient_id] = eligible_trials
+                yield patient_id, eligible_trials
+        else:
+            previous_patients = previous['patients']
+            previous_trials = previous['trials']
+            previous_matches = previous['matches']
+            dirty_trials = np.array([
+                previous_trials.get(trial['trial_id']) != fingerprint
+                for trial, fingerprint in zip(self.active_trials, trial_fingerprints)
+            ], dtype=bool)
+            clean_trial_ids = {trial['trial_id'] for trial, dirty in zip(self.active_trials, dirty_trials) if not dirty}
+            # Trials that were removed or changed since the previous run
+            stale_trials = len(previous_trials) > len(clean_trial_ids)
+
+            dirty_rows, clean_rows = [], []
+            for row, fingerprint in enumerate(patient_fingerprints):
+                patient_id = self.patient_store.patient_id(row)
+                if previous_patients.get(patient_id) == fingerprint and patient_id in previous_matches:
+                    clean_rows.append(row)
+                else:
+                    dirty_rows.append(row)
+            print(f"Incremental match: {len(dirty_rows)} of {len(patient_fingerprints)} patients "
+                  f"and {int(dirty_trials.sum())} of {len(self.active_trials)} trials changed")
+
+            results = dict(self._evaluate(dirty_rows))
+            if dirty_trials.any():
+                new_matches = dict(self._evaluate(clean_rows, dirty_trials))
+            else:
+                new_matches = {}
+            position_of = {trial['trial_id']: position for position, trial in enumerate(self.active_trials)}
+
+            for row in range(len(self.patient_store)):
+                patient_id = self.patient_store.patient_id(row)
+                if patient_id in results:
+                    matches[patient_id] = results[patient_id]
+                    yield patient_id, results[patient_id]
+                    continue
+                eligible_trials = previous_matches[patient_id]
+                if stale_trials:
+                    eligible_trials = [match for match in eligible_trials if match['trialId'] in clean_trial_ids]
+                if new_matches.get(patient_id):
+                    eligible_trials = sorted(eligible_trials + new_matches[patient_id],
+                                             key=lambda match: position_of[match['trialId']])
+                matches[patient_id] = eligible_trials
+                yield patient_id, eligible_trials
+
+        self.state.save(
+            dict(zip(self.patient_store, patient_fingerprints)),
+            {trial['trial_id']: fingerprint for trial, fingerprint in zip(self.active_trials, trial_fingerprints)},
+            matches,
+        )
+
+    def _build_indexes(self) -> None:
+        vocabulary = self.patient_store.vocabulary
+        compiled = self.compiled_trials
+        lab_criteria = None
+        if compiled is not None and compiled.trials is self.active_trials:
+            self.condition_table = compiled.condition_table
+            self.condition_table.add_conditions(vocabulary)
+            self.trial_index = compiled.trial_index
+            lab_criteria = compiled.lab_criteria
+        else:
+            self.condition_table = ConditionMatchTable(self.active_trials, vocabulary)
+            self.trial_index = TrialIndex(self.active_trials, self.condition_table)
+        self.exclusion_index = ExclusionIndex(self.active_trials, vocabulary)
+        self.lab_index = LabCriteriaIndex(self.active_trials, self.patient_store, lab_criteria)
+        self.plans = compile_plans(
+            self.active_trials, self.patient_store, self.condition_table, self.exclusion_index, self.lab_index
+        )
+        self.trial_positions = {trial['trial_id']: position for position, trial in enumerate(self.active_trials)}
+        if self.top_k:
+            # Rank of each plan by descending score bound, then position: the order ranked matching visits them in
+            order = sorted(range(len(self.plans)), key=lambda position: (
+                tuple(-bound for bound in self.plans[position].max_score), position))
+            self.bound_ranks = np.empty(len(self.plans), dtype=np.int64)
+            self.bound_ranks[order] = np.arange(len(self.plans))
+
+    def _evaluate(self, rows, trial_mask: Optional[np.ndarray] = None) -> Iterator[Tuple[str, List[Mapping]]]:
+        """Match the given patient rows, on the process pool when there are enough of them."""
+        if self.workers > 1 and len(rows) > self.chunk_size:
+            return self._match_parallel(rows, trial_mask)
+        return self._iter_rows(rows, trial_mask)
+
+    def _match_parallel(self, rows, trial_mask: Optional[np.ndarray] = None) -> Iterator[Tuple[str, List[Mapping]]]:
+        """Split patient rows into chunks over a process pool; results come back in row order."""
+        global _WORKER_MATCHER
+        chunks = [(rows[start:start + self.chunk_size], trial_mask)
+                  for start in range(0, len(rows), self.chunk_size)]
+        print(f"Matching {len(chunks)} chunks on {self.workers} worker processes")
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            _WORKER_MATCHER = self
+            initargs = (None,)
+        else:
+            context = multiprocessing.get_context()
+            initargs = (self,)
+
+        try:
+            with context.Pool(self.workers, initializer=_init_worker, initargs=initargs) as pool:
+                for results, rejections, pairs_evaluated in pool.imap(_match_chunk, chunks):
+                    for check, count in rejections.items():
+                        self.rejections[check] += count
+                    self.pairs_evaluated += pairs_evaluated
+                    yield from results
+        finally:
+            _WORKER_MATCHER = None
+
+    def _match_rows(self, rows, trial_mask: Optional[np.ndarray] = None) -> List[Tuple[str, List[Mapping]]]:
+        return list(self._iter_rows(rows, trial_mask))
+
+    def _iter_rows(self, rows, trial_mask: Optional[np.ndarray] = None) -> Iterator[Tuple[str, List[Mapping]]]:
+        n_trials = len(self.active_trials) if trial_mask is None else int(np.count_nonzero(trial_mask))
+        for row in rows:
+            patient = PatientView(self.patient_store, row)
+            self.pairs_evaluated += n_trials
+            yield patient['patient_id'], self._match_patient(patient, trial_mask)
+
+    def _match_patient(self, patient: Mapping[str, Any], trial_mask: Optional[np.ndarray] = None) -> List[MatchRecord]:
+        """trial_mask, when given, restricts matching to the trial positions set in it."""
+        eligible_trials = []
+        context = PatientContext(patient, self.condition_table, self.exclusion_index, self.lab_index)
+
+        rejections = self.rejections
+        candidates = self.trial_index.candidates(patient, context.matched_conditions, trial_mask, rejections)
+        if self.top_k:
+            return self._rank_candidates(context, candidates)
+        for position in candidates:
+            plan = self.plans[position]
+            rejected_by = plan.rejecting_check(context)
+            if rejected_by is None:
+                eligible_trials.append(self._build_record(plan, context))
+            else:
+                rejections[rejected_by] += 1
+        return eligible_trials
+
+    def _rank_candidates(self, context: PatientContext, candidates: np.ndarray) -> List[MatchRecord]:
+        """
+        The top_k accepted candidates by plan score, best first, ties going to
+        the earlier trial. Candidates are visited in descending order of their
+        plan's score bound, so once the heap is full and its weakest entry
+        beats the next bound, none of the remaining candidates can get in.
+        """
+        rejections = self.rejections
+        candidates = candidates[np.argsort(self.bound_ranks[candidates], kind='stable')]
+        # Min-heap of (score, -position, record); positions are unique, so records are never compared
+        heap = []
+        for i, position in enumerate(candidates):
+            plan = self.plans[position]
+            if len(heap) == self.top_k and (plan.max_score, -position) <= heap[0][:2]:
+                rejections['top_k'] += len(candidates) - i
+                break
+            rejected_by = plan.rejecting_check(context)
+            if rejected_by is not None:
+                rejections[rejected_by] += 1
+                continue
+            record = self._build_record(plan, context)
+            entry = (plan.score(record), -position, record)
+            if len(heap) < self.top_k:
+                heapq.heappush(heap, entry)
+                continue
+            rejections['top_k'] += 1
+            if entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        return [record for _, _, record in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+
+    def _build_record(self, plan: EligibilityPlan, context: PatientContext) -> MatchRecord:
+        """Holds the values behind the criteria _check_eligibility would list for this pair."""
+        patient = context.patient
+        labs = ()
+        if plan.lab_ranges:
+            patient_labs = patient['recent_lab_results']
+            labs = tuple(
+                (lab_code, patient_labs[lab_code], min_value, max_value)
+                for lab_code, min_value, max_value in plan.lab_ranges
+                if lab_code in patient_labs
+            )
+        return MatchRecord(
+            trial_id=plan.trial_id,
+            trial_name=plan.trial_name,
+            age=context.age,
+            gender=patient['gender'],
+            age_limits=(plan.min_age_label, plan.max_age_label),
+            conditions=tuple(self.condition_table.trial_matches(context.matched_conditions, plan.position)),
+            labs=labs,
+        )
+
+    def _check_eligibility(self, patient: Mapping[str, Any], trial: Dict) -> Optional[List[str]]:
         criteria_met = []
         if not self._check_age_criteria(patient['age'], trial):
             return None
@@ -59,39 +372,49 @@ class TrialMatcher:
             return None
         criteria_met.append("No exclusion criteria violated")
         lab_criteria = self._check_lab_criteria(patient['recent_lab_results'], trial)
-        if lab_criteria:
-            criteria_met.extend(lab_criteria)
+        if lab_criteria is None:
+            return None
+        criteria_met.extend(lab_criteria)
         
         return criteria_met
 
     def _check_age_criteria(self, patient_age: float, trial: Dict) -> bool:
         """Check if patient meets the age requirements for the trial."""
-        min_age = trial.get('minimum_age', 0)
-        max_age = trial.get('maximum_age', 150)
+        min_age = trial.get('minimum_age')
+        max_age = trial.get('maximum_age')
+        min_age = DEFAULT_MIN_AGE if min_age is None else min_age
+        max_age = DEFAULT_MAX_AGE if max_age is None else max_age
         
         return min_age <= patient_age <= max_age
 
     def _check_gender_criteria(self, patient_gender: str, trial: Dict) -> bool:
-        trial_gender = trial.get('gender', 'All')
+        trial_gender = trial.get('gender') or 'All'
         
         if trial_gender == 'All':
             return True
+        if patient_gender is None:
+            return False
             
         return patient_gender.lower() == trial_gender.lower()
 
     def _check_condition_criteria(self, patient_conditions: List[str], trial: Dict) -> Optional[List[str]]:
-        trial_conditions = trial.get('conditions', [])
+        trial_conditions = trial.get('conditions') or []
         matching_conditions = []
         
         # Convert all conditions to lowercase for comparison
         patient_conditions_lower = [c.lower() for c in patient_conditions]
-        trial_conditions_lower = [c.lower() for c in trial_conditions]
+        trial_conditions_lower = [c.lower() for c in trial_conditions if c is not None]
         
         for trial_condition in trial_conditions_lower:
             if any(self._condition_matches(trial_condition, pc) for pc in patient_conditions_lower):
-                matching_conditions.append(f"Matches trial condition: {trial_condition}")
+                matching_conditions.append(trial_condition)
                 
-        return matching_conditions if matching_conditions else None
+        return self._format_condition_matches(matching_conditions)
+
+    def _format_condition_matches(self, matching_conditions: List[str]) -> Optional[List[str]]:
+        if not matching_conditions:
+            return None
+        return [f"Matches trial condition: {trial_condition}" for trial_condition in matching_conditions]
 
     def _condition_matches(self, trial_condition: str, patient_condition: str) -> bool:
         if trial_condition == patient_condition:
@@ -121,31 +444,26 @@ class TrialMatcher:
                     
         return False
 
-    def _check_lab_criteria(self, patient_labs: Dict[str, float], trial: Dict) -> List[str]:
-        
+    def _check_lab_criteria(self, patient_labs: Mapping[str, float], trial: Dict) -> Optional[List[str]]:
+        """
+        Returns the lab criteria the patient meets, or None when a known lab
+        value falls outside a required range. Labs the patient has no value for
+        neither pass nor fail.
+        """
         matching_criteria = []
         
-       
-        lab_criteria = self._extract_lab_criteria(trial.get('inclusion_criteria', []))
+        lab_ranges = self._extract_lab_criteria(trial.get('inclusion_criteria') or [])
         
-        for lab_code, (min_value, max_value) in lab_criteria.items():
+        for lab_code, (min_value, max_value) in lab_ranges.items():
             if lab_code in patient_labs:
                 lab_value = patient_labs[lab_code]
-                if min_value <= lab_value <= max_value:
-                    matching_criteria.append(
-                        f"Lab result {lab_code}: {lab_value} within required range: {min_value}-{max_value}"
-                    )
+                if not min_value <= lab_value <= max_value:
+                    return None
+                matching_criteria.append(
+                    f"Lab result {lab_code}: {lab_value} within required range: {min_value}-{max_value}"
+                )
                     
         return matching_criteria
 
     def _extract_lab_criteria(self, inclusion_criteria: List[str]) -> Dict[str, tuple]:
-        
-        lab_criteria = {}
-        
-       
-        for criterion in inclusion_criteria:
-            if any(lab_keyword in criterion.lower() for lab_keyword in ['lab', 'test', 'level']):
- 
-                pass
-                
-        return lab_criteria
\ No newline at end of file
+        return parse_lab_criteria(inclusion_criteria)
@@ -0,0 +1,153 @@
+# src/metrics.py
+import cProfile
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Any, Optional, Sequence, TypeVar
+
+T = TypeVar('T')
+
+
+def _proc_status_mb(field: str) -> Optional[float]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> Optional[float]:
+    return _proc_status_mb('VmRSS')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size since the last reset_peak_rss(), or since process start where resets are unsupported."""
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other platforms kilobytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def reset_peak_rss() -> None:
+    """Restart the RSS high-water mark from the current RSS (Linux only; a no-op elsewhere)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class PipelineMetrics:
+    """
+    Wall time, CPU time and peak RSS per pipeline stage, plus free-form
+    counters, exported as one JSON document.
+
+    Stages measured with stage() get their own peak RSS. A stage that is
+    only timed while it produces items (timed_iter) and runs interleaved with
+    another stage shares that stage's peak.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, Any] = {}
+        self.profiler = cProfile.Profile() if profile else None
+
+    def _add(self, name: str, wall_seconds: float, cpu_seconds: float,
+             peak_rss: Optional[float] = None) -> Dict[str, Any]:
+        stage = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': None})
+        stage['wall_seconds'] += wall_seconds
+        stage['cpu_seconds'] += cpu_seconds
+        if peak_rss is not None:
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'] or 0.0, peak_rss)
+        return stage
+
+    @contextmanager
+    def stage(self, name: str, nested: Sequence[str] = ()) -> Iterator[None]:
+        """
+        Measure the enclosed block as stage name. Time that stages listed in
+        nested accumulate inside the block is not charged to this stage; they
+        are given this stage's peak RSS instead.
+        """
+        nested_before = {n: dict(self.stages.get(n, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})) for n in nested}
+        reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            peak = peak_rss_mb()
+            for n, before in nested_before.items():
+                if n in self.stages:
+                    wall -= self.stages[n]['wall_seconds'] - before['wall_seconds']
+                    cpu -= self.stages[n]['cpu_seconds'] - before['cpu_seconds']
+                    self._add(n, 0.0, 0.0, peak)
+            self._add(name, wall, cpu, peak)
+
+    @contextmanager
+    def profiled(self) -> Iterator[None]:
+        """Run the enclosed block under the profiler, if profiling is enabled."""
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+
+    def timed_iter(self, name: str, items: Iterable[T], profile: bool = False) -> Iterator[T]:
+        """
+        Yield from items, charging only the time spent producing each item to
+        stage name. With profile=True and a profiler enabled, production of
+        the items runs under the profiler.
+        """
+        profiler = self.profiler if profile else None
+        iterator = iter(items)
+        wall = cpu = 0.0
+        try:
+            while True:
+                wall_start = time.perf_counter()
+                cpu_start = time.process_time()
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                    wall += time.perf_counter() - wall_start
+                    cpu += time.process_time() - cpu_start
+                yield item
+        finally:
+            self._add(name, wall, cpu)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stages': self.stages,
+            'total_wall_seconds': sum(stage['wall_seconds'] for stage in self.stages.values()),
+            'counters': self.counters,
+        }
+
+    def save(self, path: Path) -> Path:
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def save_profile(self, path: Path) -> Optional[Path]:
+        """Write the collected profile in pstats format, if profiling was enabled."""
+        if self.profiler is None:
+            return None
+        self.profiler.dump_stats(str(path))
+        return path
@@ -1,102 +1,250 @@
 # src/output_generator.py
 import json
-import pandas as pd
-from typing import Dict, List
+import logging
+import shutil
+import textwrap
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections.abc import Mapping
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
 from datetime import datetime
+from src.match_record import criteria_count
+
+# Rows per worksheet in .xlsx, header included
+EXCEL_MAX_ROWS = 1_048_576
+
+MatchResults = Union[Mapping, Iterable[Tuple[str, List[Mapping]]]]
+
+
+class JSONMatchWriter:
+    """Writes {"matches": [...]} one patient at a time, in the same layout as json.dump(..., indent=2)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, 'w')
+        self._count = 0
+
+    def write(self, patient_id: str, eligible_trials: List[Mapping]) -> None:
+        entry = json.dumps({'patientId': patient_id, 'eligibleTrials': [dict(trial) for trial in eligible_trials]},
+                           indent=2)
+        self._file.write(('{\n  "matches": [\n' if self._count == 0 else ',\n') + textwrap.indent(entry, '    '))
+        self._count += 1
+
+    def close(self) -> Path:
+        self._file.write('\n  ]\n}' if self._count else '{\n  "matches": []\n}')
+        self._file.close()
+        return self.path
+
+    def discard(self) -> None:
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class NDJSONMatchWriter:
+    """One {"patientId", "eligibleTrials"} object per line."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, 'w')
+
+    def write(self, patient_id: str, eligible_trials: List[Mapping]) -> None:
+        self._file.write(json.dumps({'patientId': patient_id, 'eligibleTrials': [dict(trial) for trial in eligible_trials]}))
+        self._file.write('\n')
+
+    def close(self) -> Path:
+        self._file.close()
+        return self.path
+
+    def discard(self) -> None:
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class ParquetMatchWriter:
+    """
+    One row per patient/trial match, written as a directory of Parquet part
+    files of at most rows_per_file rows each. Only the current part is held in
+    memory.
+    """
+
+    SCHEMA = pa.schema([
+        ('patient_id', pa.string()),
+        ('trial_id', pa.string()),
+        ('trial_name', pa.string()),
+        ('criteria_met_count', pa.int32()),
+        ('criteria_met', pa.list_(pa.string())),
+    ])
+
+    def __init__(self, path: Path, rows_per_file: int = 250_000):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.rows_per_file = rows_per_file
+        self._parts = 0
+        self._columns = self._empty_columns()
+
+    def _empty_columns(self) -> Dict[str, list]:
+        return {name: [] for name in self.SCHEMA.names}
+
+    def write(self, patient_id: str, eligible_trials: List[Mapping]) -> None:
+        columns = self._columns
+        for trial in eligible_trials:
+            criteria_met = list(trial['eligibilityCriteriaMet'])
+            columns['patient_id'].append(patient_id)
+            columns['trial_id'].append(trial['trialId'])
+            columns['trial_name'].append(trial['trialName'])
+            columns['criteria_met_count'].append(len(criteria_met))
+            columns['criteria_met'].append(criteria_met)
+        if len(columns['patient_id']) >= self.rows_per_file:
+            self._flush()
+
+    def _flush(self) -> None:
+        table = pa.Table.from_pydict(self._columns, schema=self.SCHEMA)
+        pq.write_table(table, self.path / f'part-{self._parts:05d}.parquet')
+        self._parts += 1
+        self._columns = self._empty_columns()
+
+    def close(self) -> Path:
+        # Always write at least one part so the dataset carries its schema
+        if self._columns['patient_id'] or self._parts == 0:
+            self._flush()
+        return self.path
+
+    def discard(self) -> None:
+        self._columns = self._empty_columns()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ExcelMatchWriter:
+    """
+    Summary, Detailed Matches and Matching Criteria sheets written through an
+    openpyxl write-only workbook, so rows go to disk as they are appended. A
+    sheet that reaches EXCEL_MAX_ROWS stops taking rows; the rest are counted
+    and reported when the file is closed.
+    """
+
+    SHEETS = {
+        'Summary': ('Patient ID', 'Number of Eligible Trials', 'Trial IDs'),
+        'Detailed Matches': ('Patient ID', 'Trial ID', 'Trial Name', 'Number of Criteria Met'),
+        'Matching Criteria': ('Patient ID', 'Trial ID', 'Criterion'),
+    }
+
+    def __init__(self, path: Path, max_rows: int = EXCEL_MAX_ROWS):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_rows = max_rows
+        self._workbook = Workbook(write_only=True)
+        self._sheets = {}
+        self._rows = {}
+        self._dropped = {}
+        header_font = Font(bold=True)
+        for title, header in self.SHEETS.items():
+            sheet = self._workbook.create_sheet(title)
+            cells = []
+            for value in header:
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.font = header_font
+                cells.append(cell)
+            sheet.append(cells)
+            self._sheets[title] = sheet
+            self._rows[title] = 1
+            self._dropped[title] = 0
+
+    def _append(self, title: str, row: Sequence) -> None:
+        if self._rows[title] >= self.max_rows:
+            self._dropped[title] += 1
+            return
+        self._sheets[title].append(row)
+        self._rows[title] += 1
+
+    def write(self, patient_id: str, eligible_trials: List[Mapping]) -> None:
+        self._append('Summary', (
+            patient_id,
+            len(eligible_trials),
+            ', '.join(trial['trialId'] for trial in eligible_trials),
+        ))
+        for trial in eligible_trials:
+            self._append('Detailed Matches', (
+                patient_id, trial['trialId'], trial['trialName'], criteria_count(trial),
+            ))
+            if self._rows['Matching Criteria'] >= self.max_rows:
+                self._dropped['Matching Criteria'] += criteria_count(trial)
+                continue
+            for criterion in trial['eligibilityCriteriaMet']:
+                self._append('Matching Criteria', (patient_id, trial['trialId'], criterion))
+
+    def close(self) -> Path:
+        for title, dropped in self._dropped.items():
+            if dropped:
+                self.logger.warning(
+                    f"Excel sheet '{title}' is full at {self.max_rows} rows; {dropped} rows were left out. "
+                    f"Use the JSON, NDJSON or Parquet output for the complete results."
+                )
+        self._workbook.save(self.path)
+        return self.path
+
+    def discard(self) -> None:
+        # A write-only workbook only releases its temporary sheet files by saving
+        try:
+            self._workbook.save(self.path)
+        except Exception:
+            # Already saved by close(), or the save itself is what failed
+            pass
+        self.path.unlink(missing_ok=True)
+
 
 class OutputGenerator:
-    def __init__(self, output_directory: str):
+    WRITERS = {
+        'json': (JSONMatchWriter, '.json'),
+        'ndjson': (NDJSONMatchWriter, '.ndjson'),
+        'parquet': (ParquetMatchWriter, '.parquet'),
+        'excel': (ExcelMatchWriter, '.xlsx'),
+    }
+
+    def __init__(self, output_directory: str, formats: Sequence[str] = ('json', 'excel')):
         self.output_directory = Path(output_directory)
         self.output_directory.mkdir(parents=True, exist_ok=True)
+        unknown = set(formats) - set(self.WRITERS)
+        if unknown:
+            raise ValueError(f"Unknown output formats: {', '.join(sorted(unknown))}")
+        self.formats = list(formats)
 
-    def generate_outputs(self, matches: Dict[str, List[Dict]]) -> tuple:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        json_path = self._save_json(matches, timestamp)
-        excel_path = self._save_excel(matches, timestamp)
-        
-        return json_path, excel_path
-
-    def _save_json(self, matches: Dict[str, List[Dict]], timestamp: str) -> Path:
-        output_path = self.output_directory / f'trial_matches_{timestamp}.json'
-        
-        formatted_data = {
-            'matches': [
-                {
-                    'patientId': patient_id,
-                    'eligibleTrials': trials
-                }
-                for patient_id, trials in matches.items()
-            ]
-        }
-        
-        with open(output_path, 'w') as f:
-            json.dump(formatted_data, f, indent=2)
-            
-        return output_path
-
-    def _save_excel(self, matches: Dict[str, List[Dict]], timestamp: str) -> Path:
-        """Save matches to an Excel file with multiple sheets."""
-        output_path = self.output_directory / f'trial_matches_{timestamp}.xlsx'
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            self._create_summary_sheet(matches, writer)
-            self._create_detailed_matches_sheet(matches, writer)
-            self._create_criteria_sheet(matches, writer)
-        return output_path
-
-    def _create_summary_sheet(self, matches: Dict[str, List[Dict]], 
-                            writer: pd.ExcelWriter) -> None:
-        summary_data = {
-            'Patient ID': [],
-            'Number of Eligible Trials': [],
-            'Trial IDs': []
-        }
-        
-        for patient_id, trials in matches.items():
-            summary_data['Patient ID'].append(patient_id)
-            summary_data['Number of Eligible Trials'].append(len(trials))
-            summary_data['Trial IDs'].append(
-                ', '.join(trial['trialId'] for trial in trials)
-            )
-            
-        summary_df = pd.DataFrame(summary_data)
-        summary_df.to_excel(writer, sheet_name='Summary', index=False)
-
-    def _create_detailed_matches_sheet(self, matches: Dict[str, List[Dict]], 
-                                     writer: pd.ExcelWriter) -> None:
-        detailed_data = {
-            'Patient ID': [],
-            'Trial ID': [],
-            'Trial Name': [],
-            'Number of Criteria Met': []
-        }
-        
-        for patient_id, trials in matches.items():
-            for trial in trials:
-                detailed_data['Patient ID'].append(patient_id)
-                detailed_data['Trial ID'].append(trial['trialId'])
-                detailed_data['Trial Name'].append(trial['trialName'])
-                detailed_data['Number of Criteria Met'].append(
-                    len(trial['eligibilityCriteriaMet'])
-                )
-                
-        detailed_df = pd.DataFrame(detailed_data)
-        detailed_df.to_excel(writer, sheet_name='Detailed Matches', index=False)
-
-    def _create_criteria_sheet(self, matches: Dict[str, List[Dict]], 
-                             writer: pd.ExcelWriter) -> None:
-        criteria_data = {
-            'Patient ID': [],
-            'Trial ID': [],
-            'Criterion': []
-        }
-        
-        for patient_id, trials in matches.items():
-            for trial in trials:
-                for criterion in trial['eligibilityCriteriaMet']:
-                    criteria_data['Patient ID'].append(patient_id)
-                    criteria_data['Trial ID'].append(trial['trialId'])
-                    criteria_data['Criterion'].append(criterion)
-                    
-        criteria_df = pd.DataFrame(criteria_data)
-        criteria_df.to_excel(writer, sheet_name='Matching Criteria', index=False)
\ No newline at end of file
+    def generate_outputs(self, matches: MatchResults) -> tuple:
+        paths = self.write(matches)
+        return paths.get('json'), paths.get('excel')
+
+    def write(self, matches: MatchResults, timestamp: Optional[str] = None) -> Dict[str, Path]:
+        """
+        Stream matches, either a dict or an iterable of (patient_id,
+        eligible_trials) pairs such as TrialMatcher.iter_matches(), through
+        every configured writer in a single pass. Files are named
+        trial_matches_<timestamp>; it defaults to the current time. Returns
+        the path per format. If matches raises part-way or a writer fails to
+        close, every output of this call is removed before the error
+        propagates.
+        """
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        results = matches.items() if isinstance(matches, Mapping) else matches
+        writers = {}
+        try:
+            for output_format in self.formats:
+                writer_class, suffix = self.WRITERS[output_format]
+                writers[output_format] = writer_class(self.output_directory / f'trial_matches_{timestamp}{suffix}')
+
+            for patient_id, eligible_trials in results:
+                for writer in writers.values():
+                    writer.write(patient_id, eligible_trials)
+
+            return {output_format: writer.close() for output_format, writer in writers.items()}
+        except BaseException:
+            # Don't leave truncated outputs behind that look like complete results,
+            # including the ones that closed before another writer failed to
+            for writer in writers.values():
+                try:
+                    writer.discard()
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"Could not remove partial output {writer.path}: {str(e)}")
+            raise
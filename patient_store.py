@@ -0,0 +1,381 @@
+# src/patient_store.py
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Sequence
+
+
+def _now() -> pd.Timestamp:
+    return pd.Timestamp.now()
+
+
+def calculate_ages(birthdates: pd.Series, deathdates: pd.Series) -> pd.Series:
+    """Age in whole years at death, or today for living patients."""
+    end_dates = deathdates.fillna(_now())
+    ages = end_dates.dt.year - birthdates.dt.year
+    before_birthday = (end_dates.dt.month < birthdates.dt.month) | (
+        (end_dates.dt.month == birthdates.dt.month) & (end_dates.dt.day < birthdates.dt.day)
+    )
+    return (ages - before_birthday.astype(int)).clip(lower=0)
+
+
+class PatientView(Mapping):
+    """Read-only, dict-like view of a single patient row in a PatientStore."""
+
+    __slots__ = ('_store', 'row')
+    FIELDS = ('patient_id', 'age', 'gender', 'condition_codes', 'medication_codes', 'recent_lab_results')
+
+    def __init__(self, store: 'PatientStore', row: int):
+        self._store = store
+        self.row = row
+
+    def __getitem__(self, key: str) -> Any:
+        store = self._store
+        if key == 'patient_id':
+            return store.patient_id(self.row)
+        if key == 'age':
+            return int(store.ages[self.row])
+        if key == 'gender':
+            return store.gender(self.row)
+        if key == 'condition_codes':
+            return store.condition_codes(self.row)
+        if key == 'medication_codes':
+            return store.medication_codes(self.row)
+        if key == 'recent_lab_results':
+            return LabResultsView(store, self.row)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __repr__(self) -> str:
+        return f"PatientView({dict(self)!r})"
+
+
+class LabResultsView(Mapping):
+    """Latest numeric lab value per LOINC code for one patient, looked up on demand."""
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: 'PatientStore', row: int):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, lab_code: str) -> float:
+        value = self._store.lab_value(self._row, lab_code)
+        if value is None:
+            raise KeyError(lab_code)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for lab_code in self._store.lab_codes:
+            if self._store.lab_value(self._row, lab_code) is not None:
+                yield lab_code
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class PatientStore(Mapping):
+    """
+    Columnar patient cohort.
+
+    Ages are an int16 array, gender is stored as categorical codes and the
+    condition/medication codes are CSR-style offset + value arrays whose values
+    index into a single interned code vocabulary. Patient ids and the vocabulary
+    are fixed-width UTF-8 byte arrays. Behaves as a read-only mapping from
+    patient id to PatientView.
+
+    Latest lab values are stored column-wise (CSC): for each LOINC code in
+    lab_code_vocabulary, lab_offsets delimits a run of sorted patient rows
+    (lab_rows) and their values (lab_values), so a lab range check over the
+    whole cohort is a slice plus a NumPy comparison.
+
+    Stores built from CSVs also keep birth and death dates (datetime64[D],
+    NaT for living patients), so refresh_ages() can bring ages up to date
+    when a saved store is loaded on a later day.
+    """
+
+    ARRAY_FIELDS = (
+        'patient_ids', 'ages', 'gender_codes', 'vocabulary',
+        'condition_offsets', 'condition_values', 'medication_offsets', 'medication_values',
+        'lab_code_vocabulary', 'lab_offsets', 'lab_rows', 'lab_values',
+        'birthdates', 'deathdates',
+    )
+
+    def __init__(self, patient_ids: np.ndarray, ages: np.ndarray,
+                 gender_codes: np.ndarray, gender_categories: Sequence[str],
+                 vocabulary: np.ndarray,
+                 condition_offsets: np.ndarray, condition_values: np.ndarray,
+                 medication_offsets: np.ndarray, medication_values: np.ndarray,
+                 lab_code_vocabulary: Optional[np.ndarray] = None, lab_offsets: Optional[np.ndarray] = None,
+                 lab_rows: Optional[np.ndarray] = None, lab_values: Optional[np.ndarray] = None,
+                 birthdates: Optional[np.ndarray] = None, deathdates: Optional[np.ndarray] = None):
+        self.patient_ids = patient_ids
+        self.ages = ages
+        self.gender_codes = gender_codes
+        self.gender_categories = list(gender_categories)
+        self.vocabulary_bytes = vocabulary
+        self.vocabulary = [code.decode('utf-8') for code in vocabulary]
+        self.condition_offsets = condition_offsets
+        self.condition_values = condition_values
+        self.medication_offsets = medication_offsets
+        self.medication_values = medication_values
+        self.lab_code_vocabulary = lab_code_vocabulary if lab_code_vocabulary is not None else self._encode([])
+        self.lab_offsets = lab_offsets if lab_offsets is not None else np.zeros(1, dtype=np.int64)
+        self.lab_rows = lab_rows if lab_rows is not None else np.empty(0, dtype=np.int32)
+        self.lab_values = lab_values if lab_values is not None else np.empty(0, dtype=np.float64)
+        self.lab_codes = [code.decode('utf-8') for code in self.lab_code_vocabulary]
+        # Empty when the store was built without dates (from_records)
+        self.birthdates = birthdates if birthdates is not None else np.empty(0, dtype='datetime64[D]')
+        self.deathdates = deathdates if deathdates is not None else np.empty(0, dtype='datetime64[D]')
+        self._lab_code_ids = {code: i for i, code in enumerate(self.lab_codes)}
+        self._row_index = None
+
+    @classmethod
+    def from_frames(cls, patient_ids: Sequence[str], ages: Sequence[int], genders: pd.Series,
+                    conditions: pd.DataFrame, medications: pd.DataFrame,
+                    labs: Optional[pd.DataFrame] = None, birthdates: Optional[pd.Series] = None,
+                    deathdates: Optional[pd.Series] = None) -> 'PatientStore':
+        """
+        Build a store from patient columns plus PATIENT/CODE frames, keeping file
+        order per patient. labs holds one PATIENT/CODE/VALUE row per latest value.
+        birthdates and deathdates, if given, are kept for refresh_ages().
+        """
+        ids_index = pd.Index(patient_ids)
+        codes, vocabulary = pd.factorize(pd.concat([conditions['CODE'], medications['CODE']], ignore_index=True))
+        return cls.from_code_ids(
+            ids_index, ages, genders, vocabulary,
+            ids_index.get_indexer(conditions['PATIENT']), codes[:len(conditions)],
+            ids_index.get_indexer(medications['PATIENT']), codes[len(conditions):],
+            labs, birthdates, deathdates,
+        )
+
+    @classmethod
+    def from_code_ids(cls, patient_ids: Sequence[str], ages: Sequence[int], genders: pd.Series,
+                      vocabulary: Sequence[str],
+                      condition_rows: np.ndarray, condition_ids: np.ndarray,
+                      medication_rows: np.ndarray, medication_ids: np.ndarray,
+                      labs: Optional[pd.DataFrame] = None, birthdates: Optional[pd.Series] = None,
+                      deathdates: Optional[pd.Series] = None) -> 'PatientStore':
+        """
+        Same as from_frames, with the condition and medication codes already
+        reduced to (patient row, vocabulary id) pairs in file order. Rows of
+        -1 (patients not in patient_ids) are dropped.
+        """
+        ids_index = pd.Index(patient_ids)
+        condition_offsets, condition_values = cls._build_csr(condition_rows, condition_ids, len(ids_index))
+        medication_offsets, medication_values = cls._build_csr(medication_rows, medication_ids, len(ids_index))
+
+        if labs is None:
+            labs = pd.DataFrame({'PATIENT': [], 'CODE': [], 'VALUE': []})
+        lab_rows = ids_index.get_indexer(labs['PATIENT'])
+        known = lab_rows >= 0
+        lab_code_ids, lab_code_vocabulary = pd.factorize(labs['CODE'][known], sort=True)
+        lab_rows = lab_rows[known]
+        lab_values = labs['VALUE'].to_numpy(dtype=np.float64)[known]
+        order = np.lexsort((lab_rows, lab_code_ids))
+        lab_offsets = np.zeros(len(lab_code_vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lab_code_ids, minlength=len(lab_code_vocabulary)), out=lab_offsets[1:])
+
+        genders = pd.Categorical(genders)
+        return cls(
+            patient_ids=cls._encode(ids_index),
+            ages=np.asarray(ages, dtype=np.int16),
+            gender_codes=genders.codes.astype(np.int8),
+            gender_categories=[str(c) for c in genders.categories],
+            vocabulary=cls._encode(vocabulary),
+            condition_offsets=condition_offsets,
+            condition_values=condition_values,
+            medication_offsets=medication_offsets,
+            medication_values=medication_values,
+            lab_code_vocabulary=cls._encode(lab_code_vocabulary),
+            lab_offsets=lab_offsets,
+            lab_rows=lab_rows[order].astype(np.int32),
+            lab_values=lab_values[order],
+            birthdates=None if birthdates is None else np.asarray(birthdates, dtype='datetime64[D]'),
+            deathdates=None if deathdates is None else np.asarray(deathdates, dtype='datetime64[D]'),
+        )
+
+    @classmethod
+    def from_records(cls, patients_data: Dict[str, Dict[str, Any]]) -> 'PatientStore':
+        """Build a store from the legacy dict-of-dicts patients_data."""
+        patient_ids = list(patients_data.keys())
+        conditions = pd.DataFrame(
+            [(pid, code) for pid, p in patients_data.items() for code in p['condition_codes']],
+            columns=['PATIENT', 'CODE'],
+        )
+        medications = pd.DataFrame(
+            [(pid, code) for pid, p in patients_data.items() for code in p['medication_codes']],
+            columns=['PATIENT', 'CODE'],
+        )
+        labs = pd.DataFrame(
+            [(pid, code, value) for pid, p in patients_data.items()
+             for code, value in p.get('recent_lab_results', {}).items()],
+            columns=['PATIENT', 'CODE', 'VALUE'],
+        )
+        return cls.from_frames(
+            patient_ids,
+            [p['age'] for p in patients_data.values()],
+            pd.Series([p['gender'] for p in patients_data.values()], dtype=object),
+            conditions,
+            medications,
+            labs,
+        )
+
+    @staticmethod
+    def _build_csr(rows: np.ndarray, values: np.ndarray, n_rows: int):
+        known = rows >= 0
+        rows = rows[known]
+        values = values[known]
+        order = np.argsort(rows, kind='stable')
+        counts = np.bincount(rows, minlength=n_rows)
+        offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, values[order].astype(np.int32)
+
+    @staticmethod
+    def _encode(values: Sequence[str]) -> np.ndarray:
+        encoded = [str(v).encode('utf-8') for v in values]
+        width = max((len(v) for v in encoded), default=1) or 1
+        return np.array(encoded, dtype=f'S{width}')
+
+    def save(self, directory: Path) -> None:
+        """Write every array as a .npy file so it can be memory-mapped back by load()."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(directory / f'{name}.npy', array, allow_pickle=False)
+        with open(directory / 'store.json', 'w') as f:
+            json.dump({'gender_categories': self.gender_categories}, f)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> 'PatientStore':
+        directory = Path(directory)
+        with open(directory / 'store.json') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(directory / f'{name}.npy', mmap_mode=mmap_mode, allow_pickle=False)
+            for name in cls.ARRAY_FIELDS
+        }
+        return cls(gender_categories=meta['gender_categories'], **arrays)
+
+    def refresh_ages(self) -> None:
+        """Recompute ages as of today from the stored dates; a no-op for stores without dates."""
+        if len(self.birthdates) != len(self) or not len(self):
+            return
+        ages = calculate_ages(pd.Series(self.birthdates).astype('datetime64[ns]'),
+                              pd.Series(self.deathdates).astype('datetime64[ns]'))
+        self.ages = ages.to_numpy().astype(np.int16)
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {name: getattr(self, name) for name in self.ARRAY_FIELDS if name != 'vocabulary'}
+        arrays['vocabulary'] = self.vocabulary_bytes
+        return arrays
+
+    def __len__(self) -> int:
+        return len(self.patient_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.patient_id(row)
+
+    def __getitem__(self, patient_id: str) -> PatientView:
+        row = self.row_of(patient_id)
+        if row is None:
+            raise KeyError(patient_id)
+        return PatientView(self, row)
+
+    def row_of(self, patient_id: str) -> Optional[int]:
+        if self._row_index is None:
+            self._row_index = pd.Index(self.patient_ids)
+        try:
+            return int(self._row_index.get_loc(patient_id.encode('utf-8')))
+        except KeyError:
+            return None
+
+    def views(self, start: int = 0, stop: Optional[int] = None) -> Iterator[PatientView]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for row in range(start, stop):
+            yield PatientView(self, row)
+
+    def patient_id(self, row: int) -> str:
+        return self.patient_ids[row].decode('utf-8')
+
+    def gender(self, row: int) -> Optional[str]:
+        code = self.gender_codes[row]
+        return self.gender_categories[code] if code >= 0 else None
+
+    def condition_code_ids(self, row: int) -> np.ndarray:
+        return self.condition_values[self.condition_offsets[row]:self.condition_offsets[row + 1]]
+
+    def medication_code_ids(self, row: int) -> np.ndarray:
+        return self.medication_values[self.medication_offsets[row]:self.medication_offsets[row + 1]]
+
+    def condition_codes(self, row: int) -> List[str]:
+        return [self.vocabulary[i] for i in self.condition_code_ids(row)]
+
+    def medication_codes(self, row: int) -> List[str]:
+        return [self.vocabulary[i] for i in self.medication_code_ids(row)]
+
+    def lab_column(self, lab_code: str):
+        """(patient rows, values) of every patient with a latest value for lab_code."""
+        code_id = self._lab_code_ids.get(lab_code)
+        if code_id is None:
+            return self.lab_rows[:0], self.lab_values[:0]
+        start, stop = self.lab_offsets[code_id], self.lab_offsets[code_id + 1]
+        return self.lab_rows[start:stop], self.lab_values[start:stop]
+
+    def lab_value(self, row: int, lab_code: str) -> Optional[float]:
+        rows, values = self.lab_column(lab_code)
+        i = np.searchsorted(rows, row)
+        if i < len(rows) and rows[i] == row:
+            return float(values[i])
+        return None
+
+    def fingerprints(self) -> List[str]:
+        """
+        One short digest per row over everything matching reads: age, gender,
+        condition and medication codes in file order, and latest lab values.
+        """
+        lab_parts = [[] for _ in range(len(self))]
+        for code_id, lab_code in enumerate(self.lab_codes):
+            start, stop = self.lab_offsets[code_id], self.lab_offsets[code_id + 1]
+            for row, value in zip(self.lab_rows[start:stop].tolist(), self.lab_values[start:stop].tolist()):
+                lab_parts[row].append(f'{lab_code}={value!r}')
+
+        fingerprints = []
+        for row in range(len(self)):
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update('\x1e'.join((
+                str(int(self.ages[row])),
+                str(self.gender(row)),
+                '\x1f'.join(self.condition_codes(row)),
+                '\x1f'.join(self.medication_codes(row)),
+                '\x1f'.join(lab_parts[row]),
+            )).encode('utf-8'))
+            fingerprints.append(digest.hexdigest())
+        return fingerprints
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'patient_id': list(self),
+            'age': self.ages.astype(int),
+            'gender': [self.gender(row) for row in range(len(self))],
+            'condition_codes': [self.condition_codes(row) for row in range(len(self))],
+            'medication_codes': [self.medication_codes(row) for row in range(len(self))],
+            'recent_lab_results': [dict(LabResultsView(self, row)) for row in range(len(self))],
+        })
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._arrays().values())
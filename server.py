@@ -0,0 +1,264 @@
+# src/server.py
+"""
+Warm matching service: loads the cohort and builds the trial indexes once,
+then answers per-patient queries over HTTP on localhost.
+
+    PYTHONPATH=/path/to/project python3 -m src.server --data-dir /path/to/synthea/data \
+        --trial-cache data/cache/trials.json --port 8080
+
+    GET  /health                       patients, trials and when trials were loaded
+    GET  /patients/<patient id>/trials eligible trials for a patient in the cohort
+    GET  /trials/<trial id>/patients   count and ids of the cohort patients eligible for a trial
+    POST /match                        eligible trials for an ad-hoc patient record (JSON body)
+    POST /reload                       re-fetch trials now and swap them in if they changed
+
+Trials are also re-fetched every --reload-interval seconds; the trial scraper
+decides whether that hits the API or the cache. A refresh builds a new
+matcher next to the current one and swaps it in, so requests never wait on
+it and never see a half-built index.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+from urllib.parse import unquote
+from src.data_loader import PatientDataLoader
+from src.match_state import trial_fingerprint
+from src.matcher import TrialMatcher
+from src.patient_store import PatientView
+from src.trial_scraper import TrialFetchError, TrialScraper
+
+
+class PatientNotFound(KeyError):
+    pass
+
+
+class TrialNotFound(KeyError):
+    pass
+
+
+def parse_patient_record(record: Any) -> Dict[str, Any]:
+    """
+    Validate an ad-hoc patient record, shaped like a row of the cohort:
+
+        {"patient_id": "...", "age": 54, "gender": "F", "condition_codes": [...],
+         "medication_codes": [...], "recent_lab_results": {"4548-4": 6.9}}
+
+    Only age is required. Raises ValueError on anything malformed.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Patient record must be a JSON object")
+    age = record.get('age')
+    if isinstance(age, bool) or not isinstance(age, (int, float)):
+        raise ValueError("Patient record needs a numeric age")
+    gender = record.get('gender')
+    if gender is not None and not isinstance(gender, str):
+        raise ValueError("gender must be a string")
+    patient = {
+        'patient_id': str(record.get('patient_id') or ''),
+        'age': age,
+        'gender': gender,
+    }
+    for field in ('condition_codes', 'medication_codes'):
+        codes = record.get(field) or []
+        if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+            raise ValueError(f"{field} must be a list of strings")
+        patient[field] = codes
+    labs = record.get('recent_lab_results') or {}
+    if not isinstance(labs, dict) or not all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in labs.values()):
+        raise ValueError("recent_lab_results must map lab codes to numbers")
+    patient['recent_lab_results'] = {str(code): float(value) for code, value in labs.items()}
+    return patient
+
+
+class MatchService:
+    """
+    A prepared TrialMatcher kept in memory. Patient data is loaded once;
+    trials are swapped in whole by reload().
+    """
+
+    def __init__(self, patient_loader: PatientDataLoader, trial_scraper: TrialScraper):
+        self.logger = logging.getLogger(__name__)
+        self.patient_loader = patient_loader
+        self.trial_scraper = trial_scraper
+        self._reload_lock = threading.Lock()
+        self.matcher: Optional[TrialMatcher] = None
+        self.trial_fingerprints: Dict[str, str] = {}
+        self.loaded_at: Optional[float] = None
+        self.reload()
+        store = self.matcher.patient_store
+        if len(store):
+            # Builds the patient id and cohort indexes now rather than on the first request
+            store.row_of(store.patient_id(0))
+        if self.matcher.active_trials:
+            self.matcher.eligible_rows(self.matcher.active_trials[0]['trial_id'])
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Fetch trials and, if they changed (or force), build and swap in a new
+        matcher. Returns whether it swapped. Raises TrialFetchError, keeping
+        the current matcher, if no trials could be fetched.
+        """
+        with self._reload_lock:
+            trials = self.trial_scraper.get_active_trials()
+            if not trials:
+                # The scraper reports a failed fetch with nothing cached to fall back on as no trials
+                raise TrialFetchError("No active trials could be fetched")
+            fingerprints = {trial['trial_id']: trial_fingerprint(trial) for trial in trials}
+            if self.matcher is not None and not force and fingerprints == self.trial_fingerprints:
+                return False
+            matcher = TrialMatcher(self.patient_loader, self.trial_scraper)
+            matcher.prepare(trials)
+            if self.matcher is not None:
+                # The patient-side index does not depend on trials
+                matcher.cohort_index = self.matcher.cohort_index
+            self.matcher, self.trial_fingerprints, self.loaded_at = matcher, fingerprints, time.time()
+        self.logger.info(f"Serving {len(trials)} trials")
+        return True
+
+    def watch_trials(self, interval_seconds: float, stop: threading.Event) -> None:
+        """Call reload() every interval_seconds until stop is set."""
+        while not stop.wait(interval_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                self.logger.error(f"Trial reload failed, still serving the previous trials: {str(e)}", exc_info=True)
+
+    def status(self) -> Dict[str, Any]:
+        matcher = self.matcher
+        return {
+            'patients': len(matcher.patient_store),
+            'trials': len(matcher.active_trials),
+            'trialsLoadedAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at)),
+        }
+
+    def match_patient_id(self, patient_id: str) -> List[Dict[str, Any]]:
+        matcher = self.matcher
+        row = matcher.patient_store.row_of(patient_id)
+        if row is None:
+            raise PatientNotFound(patient_id)
+        return self._render(matcher.match_patient(PatientView(matcher.patient_store, row)))
+
+    def eligible_patients(self, trial_id: str) -> List[str]:
+        try:
+            return self.matcher.eligible_patients(trial_id)
+        except KeyError:
+            raise TrialNotFound(trial_id)
+
+    def match_record(self, record: Any) -> List[Dict[str, Any]]:
+        return self._render(self.matcher.match_patient(parse_patient_record(record)))
+
+    @staticmethod
+    def _render(eligible_trials: List[Mapping]) -> List[Dict[str, Any]]:
+        return [dict(match) for match in eligible_trials]
+
+
+class MatchRequestHandler(BaseHTTPRequestHandler):
+    service: MatchService = None
+    # Ad-hoc records are small; anything bigger is refused unread
+    MAX_BODY_BYTES = 1 << 20
+
+    def log_message(self, format: str, *args) -> None:
+        logging.getLogger(__name__).debug(format % args)
+
+    def _send_json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> Any:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        try:
+            return json.loads(self.rfile.read(length) or b'null')
+        except ValueError:
+            raise ValueError("Request body is not valid JSON")
+
+    def _route(self, method: str) -> Tuple[int, Any]:
+        parts = [unquote(part) for part in self.path.split('?', 1)[0].strip('/').split('/')]
+        if method == 'GET' and parts == ['health']:
+            return 200, self.service.status()
+        if method == 'GET' and len(parts) == 3 and parts[0] == 'patients' and parts[2] == 'trials':
+            return 200, {'patientId': parts[1], 'eligibleTrials': self.service.match_patient_id(parts[1])}
+        if method == 'GET' and len(parts) == 3 and parts[0] == 'trials' and parts[2] == 'patients':
+            patient_ids = self.service.eligible_patients(parts[1])
+            return 200, {'trialId': parts[1], 'eligiblePatients': len(patient_ids), 'patientIds': patient_ids}
+        if method == 'POST' and parts == ['match']:
+            record = self._read_json()
+            eligible_trials = self.service.match_record(record)
+            return 200, {'patientId': record.get('patient_id'), 'eligibleTrials': eligible_trials}
+        if method == 'POST' and parts == ['reload']:
+            return 200, dict(self.service.status(), reloaded=self.service.reload())
+        return 404, {'error': f"No route for {method} {self.path}"}
+
+    def _handle(self, method: str) -> None:
+        try:
+            status, body = self._route(method)
+        except PatientNotFound as e:
+            status, body = 404, {'error': f"Unknown patient: {e.args[0]}"}
+        except TrialNotFound as e:
+            status, body = 404, {'error': f"Unknown trial: {e.args[0]}"}
+        except TrialFetchError as e:
+            status, body = 503, {'error': f"Trial reload failed, still serving the previous trials: {str(e)}"}
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Request {method} {self.path} failed: {str(e)}", exc_info=True)
+            status, body = 500, {'error': 'Internal error'}
+        self._send_json(status, body)
+
+    def do_GET(self) -> None:
+        self._handle('GET')
+
+    def do_POST(self) -> None:
+        self._handle('POST')
+
+
+def serve(service: MatchService, host: str = '127.0.0.1', port: int = 8080,
+          reload_interval: Optional[float] = 300.0) -> None:
+    handler = type('BoundMatchRequestHandler', (MatchRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    stop = threading.Event()
+    if reload_interval:
+        threading.Thread(target=service.watch_trials, args=(reload_interval, stop), daemon=True).start()
+    logging.getLogger(__name__).info(f"Matching service listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data-dir', required=True)
+    parser.add_argument('--cache-dir', help='cohort cache directory')
+    parser.add_argument('--trial-cache', help='trial snapshot path')
+    parser.add_argument('--trial-cache-ttl-hours', type=float, default=24.0)
+    parser.add_argument('--offline', action='store_true', help='only serve trials from --trial-cache')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--reload-interval', type=float, default=300.0,
+                        help='seconds between trial refreshes; 0 disables them')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    service = MatchService(
+        PatientDataLoader(args.data_dir, cache_dir=args.cache_dir),
+        TrialScraper(cache_path=args.trial_cache, ttl_hours=args.trial_cache_ttl_hours, offline=args.offline),
+    )
+    serve(service, args.host, args.port, args.reload_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# src/tests/conftest.py
+import importlib.util
+import sys
+from pathlib import Path
+import pytest
+
+# The modules import each other as src.<module>. When this tree is not checked
+# out as a directory named src on sys.path, register it under that name.
+ROOT = Path(__file__).resolve().parent.parent
+if importlib.util.find_spec('src') is None:
+    _spec = importlib.util.spec_from_file_location('src', ROOT / '__init__.py', submodule_search_locations=[str(ROOT)])
+    sys.modules['src'] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules['src'])
+
+from src.benchmarks.synthetic import generate_cohort, generate_trials  # noqa: E402
+from src.trial_cache import TrialCache  # noqa: E402
+from src.tests.support import StubTrialAPI, parse_trials  # noqa: E402
+
+N_PATIENTS = 300
+N_TRIALS = 150
+SEED = 5
+
+
+@pytest.fixture(scope='session')
+def cohort_dir(tmp_path_factory) -> Path:
+    return generate_cohort(tmp_path_factory.mktemp('cohort'), N_PATIENTS, SEED)
+
+
+@pytest.fixture(scope='session')
+def raw_trials():
+    return generate_trials(N_TRIALS, SEED)
+
+
+@pytest.fixture(scope='session')
+def trials(raw_trials):
+    return parse_trials(raw_trials)
+
+
+@pytest.fixture
+def trial_snapshot(tmp_path, trials) -> Path:
+    path = tmp_path / 'trials.json'
+    TrialCache(str(path)).save(trials)
+    return path
+
+
+@pytest.fixture
+def trial_api(raw_trials):
+    api = StubTrialAPI(raw_trials)
+    yield api
+    api.close()
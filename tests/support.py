@@ -0,0 +1,92 @@
+# src/tests/support.py
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from src.benchmarks.synthetic import study_xml
+from src.trial_scraper import TrialScraper
+
+
+class StaticScraper:
+    """Stands in for TrialScraper with a fixed list of trials."""
+
+    def __init__(self, trials):
+        self.trials = trials
+
+    def get_active_trials(self):
+        return list(self.trials)
+
+
+def parse_trials(raw_trials):
+    """Synthetic trial descriptions parsed the way TrialScraper parses API responses."""
+    scraper = TrialScraper(requests_per_second=None)
+    return [scraper._parse_trial_data(ET.fromstring(study_xml(trial))) for trial in raw_trials]
+
+
+class StubTrialAPI:
+    """
+    Local stand-in for the ClinicalTrials.gov search endpoint, serving the
+    given studies by rank. Requests can be made to fail (fail_next: statuses
+    returned before serving normally, fail_always: status returned every time)
+    or slowed down per page, and every request is recorded with its arrival
+    time.
+    """
+
+    def __init__(self, raw_trials, include_count: bool = True):
+        self.trials = list(raw_trials)
+        self.include_count = include_count
+        self.fail_next = deque()
+        self.fail_always: Optional[int] = None
+        self.delay: Callable[[int], float] = lambda start: 0.0
+        self.requests: List[Tuple[float, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        query = {key: values[0] for key, values in parse_qs(urlparse(handler.path).query).items()}
+        with self._lock:
+            self.requests.append((time.monotonic(), query))
+            status = self.fail_always or (self.fail_next.popleft() if self.fail_next else 200)
+        if status != 200:
+            handler.send_response(status)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        trials = self.trials
+        if 'expr' in query:
+            wanted = set(re.findall(r'AREA\[NCTId\](\w+)', query['expr']))
+            trials = [trial for trial in trials if trial['nct_id'] in wanted]
+        start = int(query.get('min_rnk', 1))
+        stop = int(query.get('max_rnk', len(trials)))
+        time.sleep(self.delay(start))
+        studies = ''.join(study_xml(trial) for trial in trials[start - 1:stop])
+        count = f'<count>{len(trials)}</count>' if self.include_count else ''
+        body = f'<search_results>{count}{studies}</search_results>'.encode('utf-8')
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/xml')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def page_starts(self) -> List[int]:
+        return sorted(int(query['min_rnk']) for _, query in self.requests)
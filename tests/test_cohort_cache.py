@@ -0,0 +1,89 @@
+# src/tests/test_cohort_cache.py
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from src import patient_store
+from src.data_loader import PatientDataLoader
+
+
+@pytest.fixture
+def data_dir(tmp_path, cohort_dir):
+    return shutil.copytree(cohort_dir, tmp_path / 'cohort')
+
+
+def load(data_dir, cache_dir):
+    loader = PatientDataLoader(str(data_dir), cache_dir=str(cache_dir))
+    return loader.store
+
+
+def forbid_parsing(monkeypatch):
+    def parse(self):
+        raise AssertionError("the cache should have been used")
+    monkeypatch.setattr(PatientDataLoader, '_load_patient_store', parse)
+
+
+def test_warm_load_matches_fresh_parse(data_dir, tmp_path, monkeypatch):
+    fresh = PatientDataLoader(str(data_dir)).store
+    load(data_dir, tmp_path / 'cache')
+    forbid_parsing(monkeypatch)
+    cached = load(data_dir, tmp_path / 'cache')
+
+    assert list(cached) == list(fresh)
+    assert cached.fingerprints() == fresh.fingerprints()
+
+
+def test_warm_load_recomputes_ages_after_a_birthday(data_dir, tmp_path, monkeypatch):
+    patients = pd.read_csv(data_dir / 'patients.csv')
+    living = patients[patients['DEATHDATE'].isna() & ~patients['BIRTHDATE'].str.endswith('02-29')].iloc[0]
+    birthdate = pd.Timestamp(living['BIRTHDATE'])
+    day_before = pd.Timestamp(year=2030, month=birthdate.month, day=birthdate.day) - pd.Timedelta(days=1)
+
+    monkeypatch.setattr(patient_store, '_now', lambda: day_before)
+    built = load(data_dir, tmp_path / 'cache')
+    row = built.row_of(living['Id'])
+    age_before = int(built.ages[row])
+
+    monkeypatch.setattr(patient_store, '_now', lambda: day_before + pd.Timedelta(days=2))
+    fresh = PatientDataLoader(str(data_dir)).store
+    forbid_parsing(monkeypatch)
+    cached = load(data_dir, tmp_path / 'cache')
+
+    assert int(cached.ages[row]) == age_before + 1
+    assert np.array_equal(np.asarray(cached.ages), np.asarray(fresh.ages))
+
+
+def test_changed_source_invalidates_cache(data_dir, tmp_path):
+    load(data_dir, tmp_path / 'cache')
+    patients = pd.read_csv(data_dir / 'patients.csv')
+    patients = patients.iloc[1:]
+    patients.to_csv(data_dir / 'patients.csv', index=False)
+
+    assert len(load(data_dir, tmp_path / 'cache')) == len(patients)
+
+
+def test_touched_source_keeps_cache(data_dir, tmp_path, monkeypatch):
+    load(data_dir, tmp_path / 'cache')
+    os.utime(data_dir / 'conditions.csv')
+    forbid_parsing(monkeypatch)
+
+    assert len(load(data_dir, tmp_path / 'cache')) > 0
+
+
+@pytest.mark.parametrize('damage', ['garbage', 'truncated', 'missing'])
+def test_damaged_cache_is_rebuilt(data_dir, tmp_path, damage):
+    fresh = PatientDataLoader(str(data_dir)).store
+    load(data_dir, tmp_path / 'cache')
+    array_file, = (tmp_path / 'cache').glob('cohort_*/store/lab_values.npy')
+    if damage == 'garbage':
+        array_file.write_bytes(b'\x93NUMPY\x01\x00v\x00' + b'garbage' * 20)
+    elif damage == 'truncated':
+        array_file.write_bytes(array_file.read_bytes()[:200])
+    else:
+        array_file.unlink()
+
+    rebuilt = load(data_dir, tmp_path / 'cache')
+
+    pd.testing.assert_frame_equal(rebuilt.to_dataframe(), fresh.to_dataframe())
+    assert array_file.exists()
@@ -0,0 +1,23 @@
+# src/tests/test_data_loader.py
+import pandas as pd
+from src.data_loader import PatientDataLoader
+
+
+def test_small_chunks_load_the_same_store(cohort_dir):
+    whole = PatientDataLoader(str(cohort_dir)).store
+    chunked = PatientDataLoader(str(cohort_dir), chunksize=97).store
+
+    pd.testing.assert_frame_equal(chunked.to_dataframe(), whole.to_dataframe())
+    assert chunked.vocabulary == whole.vocabulary
+
+
+def test_vectorized_store_matches_the_record_loader(cohort_dir):
+    store = PatientDataLoader(str(cohort_dir), chunksize=97).store
+    records = PatientDataLoader(str(cohort_dir), vectorized=False).patients_data
+
+    assert list(store) == list(records)
+    for patient_id, patient in records.items():
+        view = store[patient_id]
+        assert view['condition_codes'] == patient['condition_codes']
+        assert view['medication_codes'] == patient['medication_codes']
+        assert dict(view['recent_lab_results']) == patient['recent_lab_results']
@@ -0,0 +1,58 @@
+# src/tests/test_incremental.py
+import shutil
+import pandas as pd
+from src.data_loader import PatientDataLoader
+from src.lab_criteria import parse_lab_criteria
+from src.matcher import TrialMatcher
+from src.tests.support import StaticScraper
+
+
+def run(data_dir, trials, state_path=None):
+    matcher = TrialMatcher(PatientDataLoader(str(data_dir)), StaticScraper(trials),
+                           state_path=str(state_path) if state_path else None)
+    matches = {patient_id: [dict(match) for match in eligible_trials]
+               for patient_id, eligible_trials in matcher.match_all_patients().items()}
+    return matches, matcher.pairs_evaluated
+
+
+def reject_on_labs(data_dir, matches, trials):
+    """Push one matched patient's lab value out of the range a lab trial it matched requires."""
+    observations_csv = data_dir / 'observations.csv'
+    observations = pd.read_csv(observations_csv, dtype=str)
+    trials_by_id = {trial['trial_id']: trial for trial in trials}
+    measured = set(zip(observations['PATIENT'], observations['CODE']))
+    for patient_id, eligible_trials in matches.items():
+        for match in eligible_trials:
+            for lab_code in parse_lab_criteria(trials_by_id[match['trialId']]['inclusion_criteria']):
+                if (patient_id, lab_code) in measured:
+                    changed = (observations['PATIENT'] == patient_id) & (observations['CODE'] == lab_code)
+                    observations.loc[changed, 'VALUE'] = '99999'
+                    observations.to_csv(observations_csv, index=False)
+                    return patient_id
+    raise AssertionError("No matched patient has a value for a lab its trial checks")
+
+
+def test_incremental_run_equals_full_run_after_changes(cohort_dir, trials, tmp_path):
+    data_dir = tmp_path / 'cohort'
+    shutil.copytree(cohort_dir, data_dir)
+    state_path = tmp_path / 'state.json'
+    first, _ = run(data_dir, trials, state_path)
+
+    # One patient's lab value and one trial's conditions change between runs
+    patient_id = reject_on_labs(data_dir, first, trials)
+    changed_trials = list(trials)
+    target = next(i for i, trial in enumerate(trials) if any(
+        trial['trial_id'] in {match['trialId'] for match in eligible_trials} for eligible_trials in first.values()))
+    donor = next(trial for trial in trials if set(trial['conditions']) != set(trials[target]['conditions']))
+    changed_trials[target] = dict(trials[target], conditions=donor['conditions'])
+
+    incremental, incremental_pairs = run(data_dir, changed_trials, state_path)
+    full, full_pairs = run(data_dir, changed_trials)
+
+    assert list(incremental) == list(full)
+    assert incremental == full
+    assert incremental[patient_id] != first[patient_id]
+    assert incremental != first
+    # Only the changed patient's row and the changed trial's column were evaluated
+    assert incremental_pairs == len(changed_trials) + len(full) - 1
+    assert full_pairs == len(changed_trials) * len(full)
@@ -0,0 +1,57 @@
+# src/tests/test_lab_criteria.py
+import numpy as np
+import pytest
+from src.data_loader import PatientDataLoader
+from src.lab_criteria import LabCriteriaIndex, parse_lab_criteria
+
+INF = float('inf')
+
+CASES = [
+    ("HbA1c between 7.0 and 10.5%", {'4548-4': (7.0, 10.5)}),
+    ("Hemoglobin A1c 7-10%", {'4548-4': (7.0, 10.0)}),
+    ("BMI from 18.5 to 40 kg/m2", {'39156-5': (18.5, 40.0)}),
+    ("LDL (mg/dL) of 100-190", {'18262-6': (100.0, 190.0)}),
+    ("eGFR >= 30 mL/min/1.73 m2", {'33914-3': (30.0, INF)}),
+    ("eGFR > 30 and <= 90 mL/min", {'33914-3': (30.0, 90.0)}),
+    ("Platelet count at least 100", {'777-3': (100.0, INF)}),
+    ("Fasting glucose less than or equal to 126 mg/dL", {'2339-0': (-INF, 126.0)}),
+    # Negated comparisons bound the other side
+    ("Hemoglobin no more than 10 g/dL", {'718-7': (-INF, 10.0)}),
+    ("Hemoglobin not less than 9 g/dL", {'718-7': (9.0, INF)}),
+    ("Serum creatinine must not be greater than 1.5 mg/dL", {'38483-4': (-INF, 1.5)}),
+    ("HbA1c not to exceed 9%", {'4548-4': (-INF, 9.0)}),
+    # Creatinine clearance is not serum creatinine
+    ("Creatinine clearance not less than 60", {}),
+    ("Creatinine clearance > 60 mL/min and serum creatinine < 1.5", {'38483-4': (-INF, 1.5)}),
+    # Only the text right after the lab name is its predicate
+    ("HbA1c >= 7 at visit 1-2", {'4548-4': (7.0, INF)}),
+    ("HbA1c measured within 3-6 months", {}),
+    ("Potassium within normal limits", {}),
+    ("Platelets at least 100 and hemoglobin >= 9", {'777-3': (100.0, INF), '718-7': (9.0, INF)}),
+]
+
+
+@pytest.mark.parametrize('criterion, expected', CASES, ids=[criterion for criterion, _ in CASES])
+def test_parse_lab_criteria(criterion, expected):
+    assert parse_lab_criteria([criterion]) == expected
+
+
+def test_bounds_on_the_same_lab_are_intersected():
+    assert parse_lab_criteria(["HbA1c >= 7", "HbA1c between 6 and 9"]) == {'4548-4': (7.0, 9.0)}
+
+
+def test_index_agrees_with_per_patient_evaluation(cohort_dir, trials):
+    store = PatientDataLoader(str(cohort_dir)).store
+    index = LabCriteriaIndex(trials, store)
+    assert len(index.lab_positions) and index.rejected_counts.sum()
+
+    expected = np.array([
+        index.rejected_mask_for({code: store.lab_value(row, code)
+                                 for criteria in index.criteria for code in criteria
+                                 if store.lab_value(row, code) is not None})
+        for row in range(len(store))
+    ])
+    assert np.array_equal(np.array([index.rejected_mask(row) for row in range(len(store))]), expected)
+    for position in range(len(trials)):
+        assert np.array_equal(index.rejected_patients(position, len(store)), expected[:, position])
+    assert np.array_equal(index.rejected_counts, expected[:, index.lab_positions].sum(axis=0))
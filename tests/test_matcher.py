@@ -0,0 +1,69 @@
+# src/tests/test_matcher.py
+import pytest
+from src.data_loader import PatientDataLoader
+from src.matcher import TrialMatcher
+from src.tests.support import StaticScraper
+
+
+def reference_matches(cohort_dir, trials):
+    """Every patient/trial pair through _check_eligibility, on the legacy dict loader."""
+    loader = PatientDataLoader(str(cohort_dir), vectorized=False)
+    matcher = TrialMatcher(loader, StaticScraper(trials))
+    matches = {}
+    for patient_id, patient in loader.patients_data.items():
+        matches[patient_id] = [
+            {'trialId': trial['trial_id'], 'trialName': trial['trial_name'], 'eligibilityCriteriaMet': criteria}
+            for trial in trials
+            for criteria in [matcher._check_eligibility(patient, trial)]
+            if criteria
+        ]
+    return matches
+
+
+@pytest.fixture(scope='module')
+def expected(cohort_dir, trials):
+    return reference_matches(cohort_dir, trials)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_indexed_matching_equals_reference(cohort_dir, trials, expected, workers):
+    matcher = TrialMatcher(PatientDataLoader(str(cohort_dir)), StaticScraper(trials), workers=workers, chunk_size=50)
+    matches = {patient_id: [dict(match) for match in eligible_trials]
+               for patient_id, eligible_trials in matcher.match_all_patients().items()}
+
+    assert list(matches) == list(expected)
+    assert matches == expected
+    assert sum(map(len, expected.values())) > len(expected)
+
+
+def test_rejections_account_for_every_pair(cohort_dir, trials, expected):
+    matcher = TrialMatcher(PatientDataLoader(str(cohort_dir)), StaticScraper(trials))
+    matches = matcher.match_all_patients()
+
+    n_matches = sum(map(len, matches.values()))
+    assert matcher.pairs_evaluated == len(matches) * len(trials)
+    assert sum(matcher.rejections.values()) + n_matches == matcher.pairs_evaluated
+
+
+def test_eligible_patients_equals_forward_matching(cohort_dir, trials, expected):
+    matcher = TrialMatcher(PatientDataLoader(str(cohort_dir)), StaticScraper(trials))
+    matcher.prepare()
+    for trial in trials:
+        forward = [patient_id for patient_id, eligible_trials in expected.items()
+                   if any(match['trialId'] == trial['trial_id'] for match in eligible_trials)]
+        assert sorted(matcher.eligible_patients(trial['trial_id'])) == sorted(forward)
+
+
+@pytest.mark.parametrize('top_k', [1, 3])
+def test_top_k_keeps_best_ranked_matches(cohort_dir, trials, top_k):
+    loader = PatientDataLoader(str(cohort_dir))
+    full = TrialMatcher(loader, StaticScraper(trials))
+    all_matches = full.match_all_patients()
+    plans = {plan.trial_id: plan for plan in full.plans}
+
+    ranked = TrialMatcher(loader, StaticScraper(trials), top_k=top_k).match_all_patients()
+
+    for patient_id, eligible_trials in all_matches.items():
+        best = sorted(eligible_trials, key=lambda match: (plans[match.trial_id].score(match),
+                                                         -plans[match.trial_id].position), reverse=True)
+        assert [match.trial_id for match in ranked[patient_id]] == [match.trial_id for match in best[:top_k]]
@@ -0,0 +1,83 @@
+# src/tests/test_output.py
+import json
+import logging
+import pyarrow.parquet as pq
+import pytest
+from openpyxl import load_workbook
+from src.output import ExcelMatchWriter, OutputGenerator
+
+MATCHES = {
+    'p1': [
+        {'trialId': 'NCT1', 'trialName': 'First', 'eligibilityCriteriaMet': ['Age 54', 'Has condition: 44054006']},
+        {'trialId': 'NCT2', 'trialName': 'Second', 'eligibilityCriteriaMet': ['Age 54']},
+    ],
+    'p2': [],
+    'p3': [{'trialId': 'NCT2', 'trialName': 'Second', 'eligibilityCriteriaMet': ['Age 61']}],
+}
+
+
+def write_all(tmp_path, matches):
+    return OutputGenerator(str(tmp_path), formats=('json', 'ndjson', 'parquet', 'excel')).write(matches, timestamp='t')
+
+
+def test_json_matches_a_plain_dump(tmp_path):
+    paths = write_all(tmp_path, MATCHES)
+
+    expected = {'matches': [{'patientId': patient_id, 'eligibleTrials': eligible_trials}
+                            for patient_id, eligible_trials in MATCHES.items()]}
+    assert paths['json'].read_text() == json.dumps(expected, indent=2)
+
+
+def test_empty_json_is_valid(tmp_path):
+    assert json.loads(write_all(tmp_path, {})['json'].read_text()) == {'matches': []}
+
+
+def test_ndjson_has_one_line_per_patient(tmp_path):
+    lines = write_all(tmp_path, MATCHES)['ndjson'].read_text().splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {'patientId': patient_id, 'eligibleTrials': eligible_trials} for patient_id, eligible_trials in MATCHES.items()
+    ]
+
+
+def test_parquet_has_one_row_per_match(tmp_path):
+    rows = pq.read_table(write_all(tmp_path, iter(MATCHES.items()))['parquet']).to_pylist()
+
+    assert [(row['patient_id'], row['trial_id'], row['criteria_met_count']) for row in rows] == [
+        ('p1', 'NCT1', 2), ('p1', 'NCT2', 1), ('p3', 'NCT2', 1),
+    ]
+    assert rows[0]['criteria_met'] == ['Age 54', 'Has condition: 44054006']
+
+
+def test_excel_sheets_stop_at_the_row_limit(tmp_path, caplog):
+    writer = ExcelMatchWriter(tmp_path / 'matches.xlsx', max_rows=3)
+    for patient_id, eligible_trials in MATCHES.items():
+        writer.write(patient_id, eligible_trials)
+    with caplog.at_level(logging.WARNING):
+        workbook = load_workbook(writer.close())
+
+    assert [row[0] for row in workbook['Summary'].iter_rows(values_only=True)] == ['Patient ID', 'p1', 'p2']
+    assert workbook['Detailed Matches'].max_row == 3
+    assert workbook['Matching Criteria'].max_row == 3
+    assert "'Summary' is full at 3 rows; 1 rows were left out" in caplog.text
+    assert "'Matching Criteria' is full at 3 rows; 2 rows were left out" in caplog.text
+
+
+def test_failed_results_leave_no_partial_outputs(tmp_path):
+    def results():
+        yield 'p1', MATCHES['p1']
+        raise RuntimeError("matching failed")
+
+    with pytest.raises(RuntimeError, match="matching failed"):
+        write_all(tmp_path, results())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_close_removes_every_output(tmp_path, monkeypatch):
+    def fail(self):
+        raise OSError("disk full")
+    monkeypatch.setattr(ExcelMatchWriter, 'close', fail)
+
+    with pytest.raises(OSError, match="disk full"):
+        write_all(tmp_path, MATCHES)
+    assert list(tmp_path.iterdir()) == []
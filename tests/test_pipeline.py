@@ -0,0 +1,53 @@
+# src/tests/test_pipeline.py
+import json
+import pytest
+from src import lab_criteria
+from src.benchmarks.synthetic import generate_cohort
+from src.main import MatchingPipeline, MultiCohortPipeline, PipelineConfig
+
+
+@pytest.fixture(scope='module')
+def cohorts_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp('cohorts')
+    for name, seed in (('north', 11), ('south', 12)):
+        generate_cohort(root / name, 120, seed)
+    return root
+
+
+def config_for(data_dir, output_dir, trial_snapshot):
+    return PipelineConfig(data_dir=str(data_dir), output_dir=str(output_dir), trial_cache_path=str(trial_snapshot),
+                          offline=True, output_formats=('json',))
+
+
+@pytest.fixture
+def single_runs(cohorts_dir, tmp_path, trial_snapshot):
+    runs = {}
+    for cohort_dir in sorted(path for path in cohorts_dir.iterdir()):
+        pipeline = MatchingPipeline(config_for(cohort_dir, tmp_path / 'single' / cohort_dir.name, trial_snapshot))
+        json_path, _ = pipeline.run()
+        runs[cohort_dir.name] = (json.loads(json_path.read_text()), pipeline.summary)
+    return runs
+
+
+@pytest.mark.parametrize('cohort_workers', [1, 2])
+def test_batch_matches_separate_runs(cohorts_dir, tmp_path, trial_snapshot, single_runs, cohort_workers):
+    config = config_for(cohorts_dir, tmp_path / 'batch', trial_snapshot)
+    report = MultiCohortPipeline(config, cohort_workers=cohort_workers).run()
+
+    assert [cohort['cohort'] for cohort in report['cohorts']] == list(single_runs)
+    for cohort in report['cohorts']:
+        matches, summary = single_runs[cohort['cohort']]
+        assert 'error' not in cohort
+        assert json.loads(open(cohort['json']).read()) == matches
+        assert cohort['summary'] == summary
+    assert list((tmp_path / 'batch').glob('batch_summary_*.json'))
+
+
+def test_batch_parses_lab_criteria_once(cohorts_dir, tmp_path, trial_snapshot, trials, monkeypatch):
+    calls = []
+    parse = lab_criteria.parse_lab_criteria
+    monkeypatch.setattr(lab_criteria, 'parse_lab_criteria', lambda criteria: calls.append(criteria) or parse(criteria))
+
+    MultiCohortPipeline(config_for(cohorts_dir, tmp_path / 'batch', trial_snapshot)).run()
+
+    assert len(calls) == len(trials)
@@ -0,0 +1,164 @@
+# src/tests/test_server.py
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pytest
+from src.data_loader import PatientDataLoader
+from src.matcher import TrialMatcher
+from src.patient_store import PatientView
+from src.server import MatchRequestHandler, MatchService, PatientNotFound
+from src.trial_scraper import TrialScraper
+from src.tests.support import StaticScraper
+
+
+class FailingScraper(StaticScraper):
+    """Serves its trials until failing is set, then reports a failed fetch the way TrialScraper does."""
+
+    failing = False
+
+    def get_active_trials(self):
+        return [] if self.failing else super().get_active_trials()
+
+
+@pytest.fixture(scope='module')
+def loader(cohort_dir):
+    return PatientDataLoader(str(cohort_dir))
+
+
+@pytest.fixture
+def scraper(trials):
+    return FailingScraper(trials)
+
+
+@pytest.fixture
+def service(loader, scraper):
+    return MatchService(loader, scraper)
+
+
+@pytest.fixture
+def server_url(service):
+    handler = type('BoundMatchRequestHandler', (MatchRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None):
+    data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def stop_after_one_wait():
+    """An Event for watch_trials that lets exactly one reload through."""
+    stop = threading.Event()
+    waits = iter([False, True])
+    stop.wait = lambda timeout=None: next(waits)
+    return stop
+
+
+def test_answers_match_a_batch_run(loader, trials, service):
+    expected = TrialMatcher(loader, StaticScraper(trials)).match_all_patients()
+    store = service.matcher.patient_store
+
+    for row in range(0, len(store), 7):
+        patient = PatientView(store, row)
+        eligible_trials = [dict(match) for match in expected[patient['patient_id']]]
+        assert service.match_patient_id(patient['patient_id']) == eligible_trials
+        record = dict(patient, recent_lab_results=dict(patient['recent_lab_results']))
+        assert service.match_record(record) == eligible_trials
+
+    for trial in trials[:20]:
+        assert service.eligible_patients(trial['trial_id']) == [
+            patient_id for patient_id, matches in expected.items()
+            if any(match['trialId'] == trial['trial_id'] for match in matches)
+        ]
+
+
+def test_routes(service, server_url, trials):
+    patient_id = service.matcher.patient_store.patient_id(0)
+
+    assert request(f'{server_url}/health') == (200, service.status())
+    status, body = request(f'{server_url}/patients/{patient_id}/trials')
+    assert status == 200 and body['eligibleTrials'] == service.match_patient_id(patient_id)
+    status, body = request(f"{server_url}/trials/{trials[0]['trial_id']}/patients")
+    assert status == 200 and body['patientIds'] == service.eligible_patients(trials[0]['trial_id'])
+    status, body = request(f'{server_url}/match', {'patient_id': 'x', 'age': 50, 'condition_codes': ['44054006']})
+    assert status == 200 and body['patientId'] == 'x'
+
+
+@pytest.mark.parametrize('path, body, status', [
+    ('/patients/nobody/trials', None, 404),
+    ('/trials/NCT00000000/patients', None, 404),
+    ('/nowhere', None, 404),
+    ('/match', b'{not json', 400),
+    ('/match', {'condition_codes': []}, 400),
+    ('/match', {'age': 50, 'condition_codes': 'E11'}, 400),
+    ('/match', {'age': 50, 'recent_lab_results': {'4548-4': 'high'}}, 400),
+])
+def test_bad_requests(server_url, path, body, status):
+    assert request(server_url + path, body)[0] == status
+
+
+def test_reload_swaps_in_changed_trials(service, scraper, trials):
+    assert service.reload() is False
+    scraper.trials = trials[:10]
+
+    assert service.reload() is True
+    assert service.status()['trials'] == 10
+    with pytest.raises(PatientNotFound):
+        service.match_patient_id('nobody')
+
+
+def test_failed_fetch_keeps_serving_the_previous_trials(service, scraper, server_url, trials):
+    before = service.status()
+    scraper.failing = True
+
+    status, body = request(f'{server_url}/reload', {})
+    assert status == 503
+    service.watch_trials(0.01, stop_after_one_wait())
+    assert service.status() == before
+    assert service.status()['trials'] == len(trials)
+
+
+def test_failed_fetch_through_the_scraper_keeps_the_trials(service, trial_api):
+    before = service.status()
+    trial_api.fail_always = 503
+    service.trial_scraper = TrialScraper(base_url=trial_api.url, max_retries=0, requests_per_second=None)
+
+    service.watch_trials(0.01, stop_after_one_wait())
+    assert trial_api.requests
+    assert service.status() == before
+
+
+def test_ad_hoc_codes_do_not_grow_the_indexes(service, server_url, monkeypatch):
+    matcher = service.matcher
+    monkeypatch.setattr(matcher.condition_table._extra_rows, 'max_size', 8)
+    monkeypatch.setattr(matcher.exclusion_index._extra_excluded_trials, 'max_size', 8)
+    vocabulary_rows = len(matcher.condition_table._rows)
+
+    for i in range(50):
+        status, _ = request(f'{server_url}/match', {'age': 50, 'condition_codes': [f'adhoc-{i}'],
+                                                   'medication_codes': [f'adhoc-med-{i}']})
+        assert status == 200
+
+    assert len(matcher.condition_table._rows) == vocabulary_rows
+    assert len(matcher.condition_table._extra_rows) <= 8
+    assert len(matcher.exclusion_index._extra_excluded_trials) <= 8
+
+
+def test_ad_hoc_ages_do_not_grow_the_age_masks(service, trials):
+    trial_index = service.matcher.trial_index
+    condition_codes = trials[0]['conditions'][:1]
+    for age in [54, *range(151, 1151), -3, 54.5]:
+        service.match_record({'age': age, 'condition_codes': condition_codes})
+
+    assert trial_index._age_masks
+    assert all(0 <= age <= 150 for age in trial_index._age_masks)
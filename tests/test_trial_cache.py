@@ -0,0 +1,78 @@
+# src/tests/test_trial_cache.py
+import json
+import time
+from src.trial_cache import TrialCache
+from src.trial_scraper import TrialScraper
+
+TTL_HOURS = 1.0
+
+
+def write_snapshot(path, trials, age_hours):
+    path.write_text(json.dumps({'fetched_at': time.time() - age_hours * 3600, 'trials': trials}))
+
+
+def cached_scraper(api, path, **kwargs):
+    return TrialScraper(cache_path=str(path), ttl_hours=TTL_HOURS, base_url=api.url, page_size=50,
+                        backoff_factor=0, requests_per_second=None, **kwargs)
+
+
+def test_fresh_cache_is_served_without_fetching(trial_api, tmp_path, trials):
+    path = tmp_path / 'trials.json'
+    write_snapshot(path, trials[:10], age_hours=0)
+
+    assert cached_scraper(trial_api, path).get_active_trials() == trials[:10]
+    assert trial_api.requests == []
+
+
+def test_missing_cache_is_fetched_and_saved(trial_api, tmp_path, trials):
+    path = tmp_path / 'trials.json'
+
+    assert cached_scraper(trial_api, path).get_active_trials() == trials
+    snapshot = TrialCache(str(path), TTL_HOURS).load()
+    assert snapshot['trials'] == trials
+    assert TrialCache(str(path), TTL_HOURS).is_fresh(snapshot)
+
+
+def test_expired_cache_refetches_only_changed_trials(trial_api, tmp_path, trials):
+    path = tmp_path / 'trials.json'
+    snapshot = [dict(trial) for trial in trials[1:]]
+    snapshot[0]['last_update'] = '2001-01-01'
+    snapshot[0]['title'] = 'Outdated title'
+    snapshot.append(dict(trials[0], trial_id='NCT99999999'))
+    write_snapshot(path, snapshot, age_hours=TTL_HOURS * 2)
+
+    refreshed = cached_scraper(trial_api, path).get_active_trials()
+
+    # New and updated trials are re-fetched, closed ones dropped, the rest kept from the snapshot
+    assert refreshed == trials
+    id_queries = [query['expr'] for _, query in trial_api.requests if 'expr' in query]
+    assert len(id_queries) == 1
+    assert sorted(id_queries[0].split(' OR ')) == sorted(f"AREA[NCTId]{trial['trial_id']}" for trial in trials[:2])
+    assert TrialCache(str(path), TTL_HOURS).load()['trials'] == trials
+
+
+def test_failed_refresh_falls_back_to_stale_cache(trial_api, tmp_path, trials):
+    path = tmp_path / 'trials.json'
+    write_snapshot(path, trials[:10], age_hours=TTL_HOURS * 2)
+    before = path.read_text()
+    trial_api.fail_always = 503
+
+    assert cached_scraper(trial_api, path, max_retries=1).get_active_trials() == trials[:10]
+    assert trial_api.requests
+    assert path.read_text() == before
+
+
+def test_offline_mode_reads_the_snapshot_however_old(trial_api, tmp_path, trials):
+    path = tmp_path / 'trials.json'
+    write_snapshot(path, trials[:10], age_hours=TTL_HOURS * 100)
+
+    assert cached_scraper(trial_api, path, offline=True).get_active_trials() == trials[:10]
+    assert cached_scraper(trial_api, tmp_path / 'missing.json', offline=True).get_active_trials() == []
+    assert trial_api.requests == []
+
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    path = tmp_path / 'trials.json'
+    path.write_text('{"fetched_at": ')
+
+    assert TrialCache(str(path)).load() is None
@@ -0,0 +1,71 @@
+# src/tests/test_trial_scraper.py
+import pytest
+from src.trial_scraper import TrialFetchError, TrialScraper
+from src.tests.support import StubTrialAPI
+
+PAGE_SIZE = 20
+
+
+def scraper_for(api, **kwargs):
+    options = dict(base_url=api.url, page_size=PAGE_SIZE, max_workers=4, backoff_factor=0, requests_per_second=None)
+    options.update(kwargs)
+    return TrialScraper(**options)
+
+
+def page_starts(trials):
+    return list(range(1, len(trials) + 1, PAGE_SIZE))
+
+
+def test_walks_every_page(trial_api, trials):
+    fetched = scraper_for(trial_api).get_active_trials()
+
+    assert fetched == trials
+    assert trial_api.page_starts() == page_starts(trials)
+
+
+def test_walks_every_page_without_a_count(raw_trials, trials):
+    api = StubTrialAPI(raw_trials, include_count=False)
+    try:
+        fetched = scraper_for(api).get_active_trials()
+    finally:
+        api.close()
+
+    assert fetched == trials
+    # Pages are requested in waves until a short one comes back
+    assert set(page_starts(trials)) <= set(api.page_starts())
+
+
+def test_keeps_page_order_when_later_pages_finish_first(trial_api, trials):
+    # Earlier pages answer last
+    trial_api.delay = lambda start: 0.02 * (len(trials) - start) / PAGE_SIZE
+
+    assert scraper_for(trial_api, max_workers=8).get_active_trials() == trials
+
+
+@pytest.mark.parametrize('status', [500, 503, 429])
+def test_retries_failed_requests(trial_api, trials, status):
+    trial_api.fail_next.extend([status, status])
+
+    assert scraper_for(trial_api, max_retries=3).get_active_trials() == trials
+    assert len(trial_api.requests) == len(page_starts(trials)) + 2
+
+
+def test_raises_once_retries_are_exhausted(trial_api):
+    trial_api.fail_always = 503
+    scraper = scraper_for(trial_api, max_retries=2)
+
+    with pytest.raises(TrialFetchError):
+        list(scraper._iter_trials())
+    assert len(trial_api.requests) == 3
+    # Without a cache to fall back to, a failed fetch yields no trials
+    assert scraper.get_active_trials() == []
+
+
+def test_respects_the_rate_limit(trial_api, trials):
+    rate = 40.0
+    scraper_for(trial_api, max_workers=8, requests_per_second=rate).get_active_trials()
+
+    times = sorted(arrival for arrival, _ in trial_api.requests)
+    assert len(times) == len(page_starts(trials))
+    # n requests at `rate` per second need (n - 1) / rate seconds, minus scheduling jitter
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
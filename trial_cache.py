@@ -0,0 +1,51 @@
+# src/trial_cache.py
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+
+class TrialCache:
+    """
+    Local snapshot of scraped trials, stored as one JSON file:
+
+        {"fetched_at": <unix time>, "trials": [<trial dict>, ...]}
+
+    The same file doubles as the input for offline runs.
+    """
+
+    def __init__(self, path: str, ttl_hours: float = 24.0):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.ttl_seconds = ttl_hours * 3600
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable trial cache {self.path}: {str(e)}")
+            return None
+        if 'trials' not in snapshot:
+            self.logger.warning(f"Ignoring trial cache without trials: {self.path}")
+            return None
+        return snapshot
+
+    def is_fresh(self, snapshot: Dict[str, Any]) -> bool:
+        return time.time() - snapshot.get('fetched_at', 0) < self.ttl_seconds
+
+    def save(self, trials: List[Dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'fetched_at': time.time(), 'trials': trials}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write trial cache {self.path}: {str(e)}")
+            return
+        self.logger.info(f"Saved {len(trials)} trials to {self.path}")
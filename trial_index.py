@@ -0,0 +1,215 @@
+# src/trial_index.py
+import numpy as np
+from typing import Dict, List, Any, Iterable, Mapping, Optional
+from src.bounded_cache import BoundedCache
+from src.lab_criteria import parse_trial_lab_criteria
+
+DEFAULT_MIN_AGE = 0
+DEFAULT_MAX_AGE = 150
+
+
+def normalize_condition(condition: str) -> str:
+    return condition.lower()
+
+
+class ConditionMatchTable:
+    """
+    Memoized match matrix between distinct trial conditions and distinct
+    patient conditions, using the same two-way substring rule as
+    TrialMatcher._condition_matches.
+
+    Each patient condition maps to a boolean row over the distinct trial
+    conditions; rows for the whole code vocabulary are computed up front.
+    Rows for any other condition (e.g. from ad-hoc patient records) are kept
+    in an LRU cache of EXTRA_ROWS entries, so arbitrary codes cannot grow the
+    table without bound. Per (patient, trial) pair the matcher then only
+    indexes that row with the trial's condition ids.
+    """
+
+    EXTRA_ROWS = 4096
+
+    def __init__(self, trials: List[Dict[str, Any]], patient_conditions: Iterable[str] = ()):
+        condition_ids: Dict[str, int] = {}
+        self.trial_condition_ids: List[np.ndarray] = []
+        for trial in trials:
+            ids = [
+                condition_ids.setdefault(normalize_condition(condition), len(condition_ids))
+                for condition in trial.get('conditions') or []
+                if condition is not None
+            ]
+            self.trial_condition_ids.append(np.array(ids, dtype=np.int64))
+        self.trial_conditions = list(condition_ids)
+        self._trial_conditions_array = np.array(self.trial_conditions, dtype=str)
+        self._rows: Dict[str, np.ndarray] = {}
+        self._extra_rows: BoundedCache[str, np.ndarray] = BoundedCache(self.EXTRA_ROWS)
+        self.add_conditions(patient_conditions)
+
+    def add_conditions(self, patient_conditions: Iterable[str]) -> None:
+        """Compute and keep the rows for these patient conditions now instead of on use."""
+        for condition in set(patient_conditions):
+            if condition not in self._rows:
+                self._rows[condition] = self._compute_row(condition)
+
+    def row(self, patient_condition: str) -> np.ndarray:
+        cached = self._rows.get(patient_condition)
+        if cached is not None:
+            return cached
+        return self._extra_rows.get(patient_condition, self._compute_row)
+
+    def _compute_row(self, patient_condition: str) -> np.ndarray:
+        pc = normalize_condition(patient_condition)
+        return (np.char.find(self._trial_conditions_array, pc) >= 0) | \
+               (np.char.find(pc, self._trial_conditions_array) >= 0)
+
+    def matched_conditions(self, patient_conditions: Iterable[str]) -> np.ndarray:
+        """Boolean mask over distinct trial conditions matched by any of the patient's conditions."""
+        matched = np.zeros(len(self.trial_conditions), dtype=bool)
+        for condition in set(patient_conditions):
+            matched |= self.row(condition)
+        return matched
+
+    def code_mask(self, condition_ids: np.ndarray, patient_conditions: np.ndarray) -> np.ndarray:
+        """
+        The transposed lookup: boolean mask over patient_conditions (normalized,
+        as a str array) that match any of the trial conditions condition_ids.
+        """
+        matched = np.zeros(len(patient_conditions), dtype=bool)
+        for trial_condition in self._trial_conditions_array[condition_ids]:
+            matched |= (np.char.find(trial_condition, patient_conditions) >= 0) | \
+                       (np.char.find(patient_conditions, trial_condition) >= 0)
+        return matched
+
+    def trial_matches(self, matched: np.ndarray, position: int) -> List[str]:
+        """The trial's own (normalized) conditions that are in the matched mask, in trial order."""
+        return [self.trial_conditions[i] for i in self.trial_condition_ids[position] if matched[i]]
+
+
+class TrialIndex:
+    """
+    Index over one batch of trials, built once per matching run.
+
+    Holds an interval structure on minimum_age/maximum_age (trials sorted by
+    minimum age, with the maximum ages in the same order), one mask per trial
+    gender and an inverted index from normalized condition to trial positions.
+    candidates() returns only the trials a patient can possibly match; the
+    full eligibility check still runs on each of them.
+    """
+
+    def __init__(self, trials: List[Dict[str, Any]], condition_table: Optional[ConditionMatchTable] = None):
+        self.trials = trials
+        self.condition_table = condition_table or ConditionMatchTable(trials)
+        n_trials = len(trials)
+
+        min_ages = np.array([self._min_age(t) for t in trials], dtype=np.float64)
+        max_ages = np.array([self._max_age(t) for t in trials], dtype=np.float64)
+        self._order_by_min_age = np.argsort(min_ages, kind='stable')
+        self._sorted_min_ages = min_ages[self._order_by_min_age]
+        self._max_ages_by_min = max_ages[self._order_by_min_age]
+        self._age_masks: Dict[int, np.ndarray] = {}
+
+        self._any_gender = np.zeros(n_trials, dtype=bool)
+        self._gender_masks: Dict[str, np.ndarray] = {}
+        for position, trial in enumerate(trials):
+            gender = trial.get('gender') or 'All'
+            if gender == 'All':
+                self._any_gender[position] = True
+            else:
+                key = gender.lower()
+                if key not in self._gender_masks:
+                    self._gender_masks[key] = np.zeros(n_trials, dtype=bool)
+                self._gender_masks[key][position] = True
+
+        condition_positions: List[List[int]] = [[] for _ in self.condition_table.trial_conditions]
+        for position, condition_ids in enumerate(self.condition_table.trial_condition_ids):
+            for condition_id in condition_ids:
+                condition_positions[condition_id].append(position)
+        self.condition_trials = [np.unique(np.array(p, dtype=np.int64)) for p in condition_positions]
+
+    def __len__(self) -> int:
+        return len(self.trials)
+
+    @staticmethod
+    def _min_age(trial: Dict[str, Any]) -> float:
+        value = trial.get('minimum_age')
+        return DEFAULT_MIN_AGE if value is None else value
+
+    @staticmethod
+    def _max_age(trial: Dict[str, Any]) -> float:
+        value = trial.get('maximum_age')
+        return DEFAULT_MAX_AGE if value is None else value
+
+    def candidates(self, patient: Mapping[str, Any], matched_conditions: Optional[np.ndarray] = None,
+                   trial_mask: Optional[np.ndarray] = None,
+                   rejections: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """
+        Sorted positions of the trials that pass age and gender and share a
+        condition with the patient, restricted to trial_mask when given.
+        rejections, if passed, is incremented per pair filtered out, against
+        the first check that removed it: condition, then age, then gender.
+        """
+        if matched_conditions is None:
+            matched_conditions = self.condition_table.matched_conditions(patient['condition_codes'])
+        condition_trials = self._trials_for_matched(matched_conditions)
+        if trial_mask is not None:
+            condition_trials = condition_trials[trial_mask[condition_trials]]
+        if rejections is not None:
+            n_pairs = len(self.trials) if trial_mask is None else int(np.count_nonzero(trial_mask))
+            rejections['condition'] += n_pairs - len(condition_trials)
+        if len(condition_trials) == 0:
+            return condition_trials
+        age_ok = self.age_mask(patient['age'])[condition_trials]
+        passed = age_ok & self.gender_mask(patient['gender'])[condition_trials]
+        if rejections is not None:
+            n_age_ok = int(np.count_nonzero(age_ok))
+            rejections['age'] += len(condition_trials) - n_age_ok
+            rejections['gender'] += n_age_ok - int(np.count_nonzero(passed))
+        return condition_trials[passed]
+
+    def age_mask(self, age: float) -> np.ndarray:
+        # Only whole ages in the default range are kept, so ad-hoc ages cannot grow the memo
+        key = int(age) if float(age).is_integer() and DEFAULT_MIN_AGE <= age <= DEFAULT_MAX_AGE else None
+        if key is not None and key in self._age_masks:
+            return self._age_masks[key]
+
+        eligible = np.zeros(len(self.trials), dtype=bool)
+        upper = np.searchsorted(self._sorted_min_ages, age, side='right')
+        within = self._max_ages_by_min[:upper] >= age
+        eligible[self._order_by_min_age[:upper][within]] = True
+
+        if key is not None:
+            self._age_masks[key] = eligible
+        return eligible
+
+    def gender_mask(self, gender: Optional[str]) -> np.ndarray:
+        if gender is None:
+            return self._any_gender
+        bucket = self._gender_masks.get(gender.lower())
+        return self._any_gender if bucket is None else self._any_gender | bucket
+
+    def _trials_for_matched(self, matched_conditions: np.ndarray) -> np.ndarray:
+        arrays = [self.condition_trials[i] for i in np.flatnonzero(matched_conditions)]
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
+
+
+class CompiledTrials:
+    """
+    The parts of a matching run that depend only on the trials: the trial
+    list, its ConditionMatchTable, its TrialIndex and the parsed lab
+    criteria. Built once and shared by every cohort matched against the same
+    trials; the cohort-specific indexes (exclusions over the cohort's
+    vocabulary, lab rejections over its values) are still built per
+    TrialMatcher.
+    """
+
+    def __init__(self, trials: List[Dict[str, Any]]):
+        self.trials = trials
+        self.condition_table = ConditionMatchTable(trials)
+        self.trial_index = TrialIndex(trials, self.condition_table)
+        self.lab_criteria = parse_trial_lab_criteria(trials)
+
+    def __len__(self) -> int:
+        return len(self.trials)
@@ -1,39 +1,265 @@
 import requests
 import xml.etree.ElementTree as ET
 import logging
+import threading
+import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
+from src.trial_cache import TrialCache
+
+
+class TrialFetchError(Exception):
+    """Raised when any page of a trial query cannot be fetched or parsed."""
+
+
+class RateLimiter:
+    """Spaces out request starts so that at most `rate` requests per second begin, across threads."""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
 
 class TrialScraper:
-    def __init__(self):
-        self.base_url = "https://clinicaltrials.gov/"
+    FIELDS = "NCTId,BriefTitle,EligibilityCriteria,Gender,MinimumAge,MaximumAge,OverallStatus,Condition,LastUpdatePostDate"
+    UPDATE_FIELDS = "NCTId,LastUpdatePostDate"
+    ID_BATCH_SIZE = 100
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    COUNT_TAGS = ('count', 'NStudiesFound')
+
+    def __init__(self, cache_path: Optional[str] = None, ttl_hours: float = 24.0, offline: bool = False,
+                 base_url: str = "https://clinicaltrials.gov/", page_size: int = 500, max_workers: int = 8,
+                 max_retries: int = 3, backoff_factor: float = 0.5,
+                 requests_per_second: Optional[float] = 10.0, timeout: float = 30.0):
+        self.base_url = base_url
         self.logger = logging.getLogger(__name__)
+        self.cache = TrialCache(cache_path, ttl_hours) if cache_path else None
+        self.offline = offline
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = self._build_session(max_retries, backoff_factor)
+
+    def _build_session(self, max_retries: int, backoff_factor: float) -> requests.Session:
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+        )
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def get_active_trials(self):
+        if self.offline:
+            return self._get_offline_trials()
+        if self.cache is None:
+            return self._fetch_trials() or []
+
+        snapshot = self.cache.load()
+        if snapshot is not None and self.cache.is_fresh(snapshot):
+            self.logger.info(f"Using {len(snapshot['trials'])} cached trials from {self.cache.path}")
+            return snapshot['trials']
+
+        if snapshot is None:
+            trials = self._fetch_trials()
+        else:
+            trials = self._refresh_trials(snapshot['trials'])
+
+        if trials is None:
+            if snapshot is None:
+                return []
+            self.logger.warning("Trial refresh failed, falling back to stale cache")
+            return snapshot['trials']
+
+        self.cache.save(trials)
+        return trials
+
+    def _get_offline_trials(self):
+        snapshot = self.cache.load() if self.cache else None
+        if snapshot is None:
+            self.logger.error("Offline mode requires an existing trial snapshot (cache_path)")
+            return []
+        self.logger.info(f"Offline mode: using {len(snapshot['trials'])} trials from {self.cache.path}")
+        return snapshot['trials']
+
+    def _refresh_trials(self, cached_trials):
+        """Re-fetch only the studies whose last update date changed since the snapshot."""
+        updates = self._fetch_trial_updates()
+        if updates is None:
+            return None
+
+        cached = {trial['trial_id']: trial for trial in cached_trials}
+        changed_ids = [
+            trial_id for trial_id, last_update in updates.items()
+            if trial_id not in cached or cached[trial_id].get('last_update') != last_update
+        ]
+        self.logger.info(
+            f"Trial refresh: {len(changed_ids)} new or updated, "
+            f"{len(set(cached) - set(updates))} no longer recruiting"
+        )
+
+        batches = [changed_ids[start:start + self.ID_BATCH_SIZE]
+                   for start in range(0, len(changed_ids), self.ID_BATCH_SIZE)]
+        refreshed = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pages = executor.map(self._fetch_page, [
+                    {
+                        "fields": self.FIELDS,
+                        "expr": " OR ".join(f"AREA[NCTId]{trial_id}" for trial_id in batch),
+                        "min_rnk": 1,
+                        "max_rnk": len(batch),
+                    }
+                    for batch in batches
+                ], [self._parse_trial_data] * len(batches))
+                for trials, _ in pages:
+                    refreshed.update((trial['trial_id'], trial) for trial in trials if trial)
+        except TrialFetchError as e:
+            self.logger.error(str(e))
+            return None
+
+        return [refreshed.get(trial_id) or cached[trial_id] for trial_id in updates
+                if trial_id in refreshed or trial_id in cached]
+
+    def _fetch_trial_updates(self) -> Optional[Dict[str, Optional[str]]]:
+        def parse_update(clinical_study):
+            return self._get_text(clinical_study, 'nct_id'), self._get_text(clinical_study, 'last_update_posted')
+
+        try:
+            return {
+                trial_id: last_update
+                for trial_id, last_update in self._iter_query({"fields": self.UPDATE_FIELDS}, parse_update)
+                if trial_id
+            }
+        except TrialFetchError as e:
+            self.logger.error(str(e))
+            return None
+
+    def _fetch_trials(self):
+        try:
+            return list(self._iter_trials())
+        except TrialFetchError as e:
+            self.logger.error(str(e))
+            return None
+
+    def _iter_trials(self) -> Iterator[Dict[str, Any]]:
+        seen = set()
+        for trial in self._iter_query({"fields": self.FIELDS}, self._parse_trial_data):
+            # Results can shift between page requests; keep the first copy of each study
+            if trial and trial['trial_id'] not in seen:
+                seen.add(trial['trial_id'])
+                yield trial
+
+    def _iter_query(self, params: Dict[str, Any], parse: Callable[[ET.Element], Any]) -> Iterator[Any]:
+        """
+        Stream every page of a query, yielding parse(clinical_study) per study in
+        page order. The first page is parsed in this thread; as soon as it
+        reports a total count the remaining pages are requested concurrently.
+        Without a count, pages are fetched in waves of max_workers until a short
+        page comes back. Raises TrialFetchError if any page fails.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = None
+            first_page_length = 0
+            for kind, value in self._stream_page(self._page_params(params, 1), parse):
+                if kind == 'count':
+                    starts = range(1 + self.page_size, value + 1, self.page_size)
+                    futures = [executor.submit(self._fetch_page, self._page_params(params, start), parse)
+                               for start in starts]
+                else:
+                    first_page_length += 1
+                    yield value
+
+            if futures is not None:
+                for future in futures:
+                    yield from future.result()[0]
+                return
+
+            page_length = first_page_length
+            next_start = 1 + self.page_size
+            while page_length >= self.page_size:
+                wave = [executor.submit(self._fetch_page, self._page_params(params, next_start + i * self.page_size), parse)
+                        for i in range(self.max_workers)]
+                for future in wave:
+                    records, page_length = future.result()
+                    yield from records
+                    if page_length < self.page_size:
+                        break
+                next_start += self.max_workers * self.page_size
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _page_params(self, params: Dict[str, Any], start: int) -> Dict[str, Any]:
+        return dict(params, min_rnk=start, max_rnk=start + self.page_size - 1)
+
+    def _fetch_page(self, params: Dict[str, Any], parse: Callable[[ET.Element], Any]) -> Tuple[List[Any], int]:
+        records = [value for kind, value in self._stream_page(params, parse) if kind == 'record']
+        return records, len(records)
+
+    def _stream_page(self, extra_params: Dict[str, Any], parse: Callable[[ET.Element], Any]) -> Iterator[Tuple[str, Any]]:
+        """
+        Incrementally parse one response off the socket. Yields ('count', n) for
+        a top-level result count and ('record', parse(study)) for each
+        clinical_study as soon as it is complete; each study element is freed
+        once parsed, so memory stays bounded per study.
+        """
         params = {
         "status":"Recruiting",
-        "fields": "NCTId,BriefTitle,EligibilityCriteria,Gender,MinimumAge,MaximumAge,OverallStatus,Condition",
         "fmt": "xml",
-        "max_rnk": 100
         }
-        print("API request URL:", self.base_url)
-        print("API request parameters:", params)
-        response = requests.get(self.base_url, params=params)
-        logging.info(f"Response content: {response.content.decode('utf-8')[:500]}")  # Log first 500 characters
-
-        if response.status_code != 200:
-            self.logger.error(f"API request failed with status code {response.status_code}")
-            return []
+        params.update(extra_params)
+        self.logger.debug(f"API request {self.base_url} {params}")
+        self.rate_limiter.wait()
         try:
-            root = ET.fromstring(response.content)
-        except ET.ParseError as e:
-            self.logger.error(f"Failed to parse XML: {str(e)}")
-            return []
-        trials = []
-        
-        for clinical_study in root.findall('clinical_study'):
-            trial = self._parse_trial_data(clinical_study)
-            if trial:
-                trials.append(trial)
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise TrialFetchError(f"API request failed: {str(e)}") from e
 
-        return trials
+        with response:
+            if response.status_code != 200:
+                raise TrialFetchError(f"API request failed with status code {response.status_code}")
+            response.raw.decode_content = True
+            root = None
+            depth = 0
+            try:
+                for event, elem in ET.iterparse(response.raw, events=('start', 'end')):
+                    if event == 'start':
+                        if root is None:
+                            root = elem
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth != 1:
+                        continue
+                    if elem.tag == 'clinical_study':
+                        yield 'record', parse(elem)
+                        root.clear()
+                    elif elem.tag in self.COUNT_TAGS and elem.text and elem.text.strip().isdigit():
+                        yield 'count', int(elem.text)
+            except ET.ParseError as e:
+                raise TrialFetchError(f"Failed to parse XML: {str(e)}") from e
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                raise TrialFetchError(f"API response interrupted: {str(e)}") from e
 
     def _parse_trial_data(self, clinical_study):
         trial = {
@@ -47,7 +273,8 @@ class TrialScraper:
             'minimum_age': self._parse_age(self._get_text(clinical_study, 'minimum_age')),
             'maximum_age': self._parse_age(self._get_text(clinical_study, 'maximum_age')),
             'gender': self._get_text(clinical_study, 'gender'),
-            'healthy_volunteers': self._get_text(clinical_study, 'healthy_volunteers') == 'Accepts Healthy Volunteers'
+            'healthy_volunteers': self._get_text(clinical_study, 'healthy_volunteers') == 'Accepts Healthy Volunteers',
+            'last_update': self._get_text(clinical_study, 'last_update_posted'),
         }
 
         return trial if trial['trial_id'] else None